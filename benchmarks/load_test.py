@@ -0,0 +1,394 @@
+# Load test simulating concurrent users of the dashboard.
+#
+# Usage (from the project root):
+#   python -m benchmarks.load_test                              start the app and test 1, 10 and 50 users
+#   python -m benchmarks.load_test --concurrency 200 --server gunicorn --workers 4 --threads 8
+#   python -m benchmarks.load_test --url http://127.0.0.1:8050  test an app that is already running
+#
+# Each simulated user replays a random session of slider moves, map mode
+# buttons, country clicks and heatmap changes by POSTing the same payloads as
+# the browser to /_dash-update-component: every callback listening to the
+# changed input is called, concurrently like Dash does. The throughput and
+# the p50 / p95 / p99 latency of each callback are printed for each
+# concurrency level and written to a JSON file.
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+import numpy as np
+
+from src.utils import draw_graph, store_data
+
+resultsPath = "benchmarks/results/load_test.json"
+datasetPath = "data/cleaned/world-education-data"
+years = range(1999, 2024)
+# Relative frequency of each action in a session
+actionWeights = {
+    "moveSlider": 0.7,
+    "changeMapMode": 0.1,
+    "clickCountry": 0.1,
+    "changeHeatMap": 0.1,
+}
+
+
+class DashClient:
+    # Keeps one connection per concurrent request, as a browser does
+    def __init__(self, url: str, dependencies: list[dict[str, Any]]) -> None:
+        self.address = urllib.parse.urlsplit(url)
+        self.dependencies = dependencies
+        self.connections: list[http.client.HTTPConnection] = []
+        self.lock = threading.Lock()
+
+    def getConnection(self) -> http.client.HTTPConnection:
+        with self.lock:
+            if self.connections:
+                return self.connections.pop()
+        return http.client.HTTPConnection(
+            self.address.hostname, self.address.port, timeout=60
+        )
+
+    def releaseConnection(self, connection: http.client.HTTPConnection) -> None:
+        with self.lock:
+            self.connections.append(connection)
+
+    def post(self, payload: dict[str, Any]) -> tuple[bool, float]:
+        # (success, latency in seconds) of one callback request
+        body = json.dumps(payload)
+        connection = self.getConnection()
+        start = time.perf_counter()
+        try:
+            connection.request(
+                "POST",
+                "/_dash-update-component",
+                body=body,
+                headers={
+                    "Content-Type": "application/json",
+                    "Accept-Encoding": "gzip, br",
+                },
+            )
+            response = connection.getresponse()
+            response.read()
+            isSuccess = response.status in (200, 204)
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            isSuccess = False
+        latency = time.perf_counter() - start
+        self.releaseConnection(connection)
+        return isSuccess, latency
+
+    def close(self) -> None:
+        for connection in self.connections:
+            connection.close()
+
+
+def getOutputs(dependency: dict[str, Any]) -> list[dict[str, str]]:
+    output = dependency["output"]
+    outputNames = output[2:-2].split("...") if output.startswith("..") else [output]
+    outputs = []
+    for outputName in outputNames:
+        componentId, componentProperty = outputName.split(".", 1)
+        # Outputs declared with allow_duplicate carry a @hash suffix
+        outputs.append(
+            {"id": componentId, "property": componentProperty.split("@")[0]}
+        )
+    return outputs
+
+
+def getCallbackName(dependency: dict[str, Any], changedInput: str) -> str:
+    # e.g. year-slider.value -> educationWorldMap
+    return f"{changedInput} -> {getOutputs(dependency)[0]['id']}"
+
+
+def buildPayload(
+    dependency: dict[str, Any], values: dict[str, Any], changedInput: str
+) -> dict[str, Any]:
+    outputs = getOutputs(dependency)
+
+    def withValues(items: list[dict[str, str]]) -> list[dict[str, Any]]:
+        return [
+            {**item, "value": values.get(f"{item['id']}.{item['property']}")}
+            for item in items
+        ]
+
+    return {
+        "output": dependency["output"],
+        "outputs": outputs if dependency["output"].startswith("..") else outputs[0],
+        "inputs": withValues(dependency["inputs"]),
+        "state": withValues(dependency["state"]),
+        "changedPropIds": [changedInput],
+    }
+
+
+def generateSession(
+    randomGenerator: random.Random, countryNames: list[str], actions: int
+) -> Iterator[tuple[str, dict[str, Any]]]:
+    # Changed input and new values of the components for each user action
+    values = {
+        "year-slider.value": 2020,
+        "mapSchoolType.data": True,
+        "map-button-elementary.n_clicks": None,
+        "map-button-secondary.n_clicks": None,
+        "heatmap-switch.on": False,
+        "heatmap-year-range.value": [years[0], years[-1]],
+        "heatmap-continents.value": list(draw_graph.continent_colors),
+        "educationWorldMap.clickData": None,
+    }
+    for _ in range(actions):
+        action = randomGenerator.choices(
+            list(actionWeights), weights=list(actionWeights.values())
+        )[0]
+        if action == "moveSlider":
+            # Mostly one step at a time, sometimes a jump
+            year = values["year-slider.value"] + randomGenerator.choice(
+                [-1, 1, -1, 1, randomGenerator.randint(-10, 10)]
+            )
+            values["year-slider.value"] = min(max(year, years[0]), years[-1])
+            changedInput = "year-slider.value"
+        elif action == "changeMapMode":
+            displayPrimary = not values["mapSchoolType.data"]
+            values["mapSchoolType.data"] = displayPrimary
+            changedInput = (
+                "map-button-elementary.n_clicks"
+                if displayPrimary
+                else "map-button-secondary.n_clicks"
+            )
+            values[changedInput] = (values[changedInput] or 0) + 1
+        elif action == "clickCountry":
+            values["educationWorldMap.clickData"] = {
+                "points": [{"hovertext": randomGenerator.choice(countryNames)}]
+            }
+            changedInput = "educationWorldMap.clickData"
+        elif randomGenerator.random() < 0.5:
+            values["heatmap-switch.on"] = not values["heatmap-switch.on"]
+            changedInput = "heatmap-switch.on"
+        else:
+            first = randomGenerator.randint(years[0], years[-1])
+            values["heatmap-year-range.value"] = [
+                first,
+                randomGenerator.randint(first, years[-1]),
+            ]
+            changedInput = "heatmap-year-range.value"
+        yield changedInput, dict(values)
+
+
+def runUser(
+    client: DashClient,
+    seed: int,
+    countryNames: list[str],
+    actions: int,
+    latencies: dict[str, list[float]],
+    errors: dict[str, int],
+    lock: threading.Lock,
+) -> None:
+    randomGenerator = random.Random(seed)
+    with ThreadPoolExecutor(max_workers=4) as requestPool:
+        for changedInput, values in generateSession(
+            randomGenerator, countryNames, actions
+        ):
+            componentId, componentProperty = changedInput.split(".")
+            dependencies = [
+                dependency
+                for dependency in client.dependencies
+                if {"id": componentId, "property": componentProperty}
+                in dependency["inputs"]
+            ]
+            payloads = [
+                buildPayload(dependency, values, changedInput)
+                for dependency in dependencies
+            ]
+            for dependency, (isSuccess, latency) in zip(
+                dependencies, requestPool.map(client.post, payloads)
+            ):
+                callbackName = getCallbackName(dependency, changedInput)
+                with lock:
+                    if isSuccess:
+                        latencies.setdefault(callbackName, []).append(latency)
+                    else:
+                        errors[callbackName] = errors.get(callbackName, 0) + 1
+
+
+def runLevel(
+    url: str,
+    dependencies: list[dict[str, Any]],
+    countryNames: list[str],
+    concurrency: int,
+    actions: int,
+) -> dict[str, Any]:
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    lock = threading.Lock()
+    clients = [DashClient(url, dependencies) for _ in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as userPool:
+        for userFuture in [
+            userPool.submit(
+                runUser, client, seed, countryNames, actions, latencies, errors, lock
+            )
+            for seed, client in enumerate(clients)
+        ]:
+            userFuture.result()
+    duration = time.perf_counter() - start
+    for client in clients:
+        client.close()
+
+    callbacks = {}
+    for callbackName in sorted(set(latencies) | set(errors)):
+        callbackLatencies = np.array(latencies.get(callbackName, [np.nan])) * 1000
+        p50, p95, p99 = np.percentile(callbackLatencies, [50, 95, 99])
+        callbacks[callbackName] = {
+            "requests": len(latencies.get(callbackName, [])),
+            "errors": errors.get(callbackName, 0),
+            "p50_ms": p50,
+            "p95_ms": p95,
+            "p99_ms": p99,
+        }
+    requests = sum(callback["requests"] for callback in callbacks.values())
+    return {
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "requests": requests,
+        "errors": sum(errors.values()),
+        "throughput_rps": requests / duration,
+        "callbacks": callbacks,
+    }
+
+
+def printLevel(result: dict[str, Any]) -> None:
+    print(
+        f"\n{result['concurrency']} users: {result['requests']} requests in "
+        f"{result['duration_s']:.1f} s, {result['throughput_rps']:.1f} requests/s, "
+        f"{result['errors']} errors"
+    )
+    print(f"  {'callback':<58} {'requests':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for callbackName, callback in result["callbacks"].items():
+        print(
+            f"  {callbackName:<58} {callback['requests']:>8} {callback['p50_ms']:>9.1f}"
+            f" {callback['p95_ms']:>9.1f} {callback['p99_ms']:>9.1f}"
+        )
+
+
+def getFreePort() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def startServer(server: str, workers: int, threads: int) -> tuple[subprocess.Popen, str]:
+    port = getFreePort()
+    if server == "gunicorn":
+        command = [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--workers",
+            str(workers),
+            "--threads",
+            str(threads),
+            "--bind",
+            f"127.0.0.1:{port}",
+            "main:server",
+        ]
+    else:
+        command = [
+            sys.executable,
+            "-c",
+            "from werkzeug.serving import run_simple; import main; "
+            f"run_simple('127.0.0.1', {port}, main.server, threaded=True)",
+        ]
+    process = subprocess.Popen(
+        command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+def getDependencies(url: str, timeout: float) -> list[dict[str, Any]]:
+    # Waits for the app to answer, then returns its callback definitions
+    address = urllib.parse.urlsplit(url)
+    deadline = time.monotonic() + timeout
+    while True:
+        connection = http.client.HTTPConnection(
+            address.hostname, address.port, timeout=10
+        )
+        try:
+            connection.request("GET", "/_dash-dependencies")
+            response = connection.getresponse()
+            if response.status == 200:
+                return json.loads(response.read())
+        except OSError:
+            pass
+        finally:
+            connection.close()
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{url} did not answer within {timeout} s")
+        time.sleep(0.5)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Load test of the dashboard callbacks with concurrent simulated users"
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument(
+        "--actions", type=int, default=50, help="actions of each simulated user"
+    )
+    parser.add_argument(
+        "--url", help="test an app already running at this address instead"
+    )
+    parser.add_argument(
+        "--server", choices=["werkzeug", "gunicorn"], default="werkzeug"
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--output", default=resultsPath)
+    arguments = parser.parse_args()
+
+    process = None
+    url = arguments.url
+    if url is None:
+        process, url = startServer(arguments.server, arguments.workers, arguments.threads)
+    try:
+        dependencies = getDependencies(url, timeout=120)
+        countryNames = sorted(
+            store_data.readDataset(datasetPath, columns=["country"])["country"].unique()
+        )
+        results = []
+        for concurrency in arguments.concurrency:
+            result = runLevel(
+                url, dependencies, countryNames, concurrency, arguments.actions
+            )
+            printLevel(result)
+            results.append(result)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    os.makedirs(os.path.dirname(arguments.output), exist_ok=True)
+    with open(arguments.output, "w") as f:
+        json.dump(
+            {
+                "url": url,
+                "server": None if arguments.url else arguments.server,
+                "workers": arguments.workers if arguments.server == "gunicorn" else 1,
+                "threads": arguments.threads if arguments.server == "gunicorn" else None,
+                "levels": results,
+            },
+            f,
+            indent=2,
+        )
+    return 1 if any(result["errors"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+# Benchmarks of the data shaping, figure building and callback layers.
+#
+# Usage (from the project root):
+#   python -m benchmarks.run_benchmarks                  run and compare to the baseline
+#   python -m benchmarks.run_benchmarks --save-baseline  store the results as the new baseline
+#
+# Each benchmark runs on the real dataset and on synthetic datasets with more
+# countries and years, its median time per call is written to a JSON file and
+# compared to benchmarks/baseline.json. The exit code is 1 if one is slower than
+# the baseline by more than the threshold, or if the app takes longer to start
+# than config.STARTUP_TIME_BUDGET_SECONDS.
+# The times are compared relative to a calibration benchmark (a fixed numpy,
+# pandas and Python workload) run with them, so that a baseline saved on one
+# machine can be used on a faster or slower one.
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pds
+
+import config
+from src.utils import draw_graph, figure_cache, format_graph_data, store_data
+
+datasetPath = "data/cleaned/world-education-data"
+resultsPath = "benchmarks/results/latest.json"
+baselinePath = "benchmarks/baseline.json"
+# Factors applied to the number of countries and of years of the real dataset
+scales = {
+    "x1": (1, 1),
+    "x10": (5, 2),
+    "x100": (25, 4),
+}
+benchmarkYear = 2020
+startupKey = "startup.importMain"
+calibrationRows = 200_000
+
+
+def makeSyntheticDataset(
+    baseData: pds.DataFrame,
+    countries: pds.DataFrame,
+    countryFactor: int,
+    yearFactor: int,
+) -> tuple[pds.DataFrame, pds.DataFrame]:
+    # Copy every country countryFactor times under new names and codes, and
+    # repeat its years yearFactor times before the real ones. Returns the data
+    # and its country dimension table.
+    countryCopies = []
+    for countryCopy in range(countryFactor):
+        copy = countries.copy()
+        if countryCopy > 0:
+            copy["country"] = copy["country"] + f" #{countryCopy}"
+            copy["country_code"] = copy["country_code"] + f"{countryCopy}"
+        countryCopies.append(copy)
+    # As in a written dataset, the keys follow the order of the names
+    syntheticCountries = pds.concat(countryCopies, ignore_index=True)
+    order = np.argsort(syntheticCountries["country"].to_numpy(), kind="stable")
+    syntheticKeys = np.empty(len(order), dtype=int)
+    syntheticKeys[order] = np.arange(len(order))
+    syntheticCountries = syntheticCountries.iloc[order].reset_index(drop=True)
+
+    yearSpan = int(baseData["year"].max() - baseData["year"].min() + 1)
+    copies = []
+    for countryCopy in range(countryFactor):
+        for yearCopy in range(yearFactor):
+            copy = baseData.copy()
+            copy["year"] = copy["year"].astype(int) - yearCopy * yearSpan
+            copy["country_id"] = syntheticKeys[
+                copy["country_id"].to_numpy() + countryCopy * len(countries)
+            ]
+            copies.append(copy)
+
+    syntheticData = pds.concat(copies, ignore_index=True)
+    keys = syntheticData["country_id"].to_numpy()
+    for columnName in store_data.countryColumns:
+        syntheticData[columnName] = store_data.getCountryColumn(
+            syntheticCountries, columnName, keys
+        )
+    syntheticData["year"] = syntheticData["year"].astype(store_data.yearType)
+    syntheticData = syntheticData.sort_values(
+        by=["country_id", "year"], ignore_index=True
+    )
+    return syntheticData, syntheticCountries
+
+
+def timeCall(function: Callable, repeat: int) -> dict[str, float]:
+    # Median and minimum duration of one call, in milliseconds
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    durations = [
+        duration / number * 1000 for duration in timer.repeat(repeat, number)
+    ]
+    return {
+        "median_ms": statistics.median(durations),
+        "min_ms": min(durations),
+        "calls": number * repeat,
+    }
+
+
+def timeStartup(repeat: int) -> dict[str, float]:
+    # Wall time of a new interpreter importing main.py, as for a new worker, in milliseconds
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], check=True)
+        durations.append((time.perf_counter() - start) * 1000)
+    return {
+        "median_ms": statistics.median(durations),
+        "min_ms": min(durations),
+        "calls": repeat,
+    }
+
+
+def getDataBenchmarks(
+    baseData: pds.DataFrame, countries: pds.DataFrame
+) -> dict[str, Callable]:
+    cube = format_graph_data.buildAsOfCube(baseData, countries)
+    rollups = format_graph_data.buildRollups(cube)
+    countryIndex = format_graph_data.buildCountryIndex(baseData, countries)
+    countryKey = int(baseData["country_id"].iloc[0])
+    indicators = [
+        baseData[columnName].to_numpy()
+        for columnName in format_graph_data.indicatorColumns
+    ]
+    return {
+        "data.buildAsOfCube": lambda: format_graph_data.buildAsOfCube(
+            baseData, countries
+        ),
+        "data.buildRollups": lambda: format_graph_data.buildRollups(cube),
+        "data.buildCountryIndex": lambda: format_graph_data.buildCountryIndex(
+            baseData, countries
+        ),
+        "data.getMapData": lambda: format_graph_data.getMapData(
+            baseData, benchmarkYear, True
+        ),
+        "data.getMapDataFromCube": lambda: format_graph_data.getMapDataFromCube(
+            cube, benchmarkYear, True
+        ),
+        "data.getContinentEducationData": lambda: format_graph_data.getContinentEducationData(
+            baseData, benchmarkYear
+        ),
+        "data.getContinentEducationDataFromCube": lambda: format_graph_data.getContinentEducationDataFromCube(
+            cube, benchmarkYear
+        ),
+        "data.getContinentEducationDataFromRollups": lambda: format_graph_data.getContinentEducationDataFromRollups(
+            rollups, benchmarkYear
+        ),
+        "data.getBubbleData": lambda: format_graph_data.getBubbleData(
+            baseData, benchmarkYear
+        ),
+        "data.getCorrelationData": lambda: format_graph_data.getCorrelationData(
+            baseData
+        ),
+        "data.getPairwiseCorrelation": lambda: format_graph_data.getPairwiseCorrelation(
+            indicators
+        ),
+        "data.getCountryData": lambda: format_graph_data.getCountryData(
+            countryIndex, countryKey
+        ),
+    }
+
+
+def getFigureBenchmarks(
+    baseData: pds.DataFrame, countryTable: pds.DataFrame
+) -> dict[str, Callable]:
+    cube = format_graph_data.buildAsOfCube(baseData, countryTable)
+    mapData, maxPupilTeacher = format_graph_data.getMapDataFromCube(
+        cube, benchmarkYear, True
+    )
+    bubbleData = format_graph_data.getBubbleData(baseData, benchmarkYear)
+    continentData = format_graph_data.getContinentEducationDataFromCube(
+        cube, benchmarkYear
+    )
+    countryIndex = format_graph_data.buildCountryIndex(baseData, countryTable)
+    countryData = format_graph_data.getCountryData(
+        countryIndex, int(baseData["country_id"].iloc[0])
+    )
+    countries = "/assets/countries.geo.json"
+    return {
+        "figure.drawEducationWorldMap": lambda: draw_graph.drawEducationWorldMap(
+            mapData, countries, True, maxPupilTeacher
+        ),
+        "figure.patchEducationWorldMap": lambda: draw_graph.patchEducationWorldMap(
+            mapData, True, maxPupilTeacher
+        ),
+        "figure.drawBubbleGraph": lambda: draw_graph.drawBubbleGraph(bubbleData),
+        "figure.patchBubbleGraph": lambda: draw_graph.patchBubbleGraph(bubbleData),
+        "figure.drawContinentGDPGraph": lambda: draw_graph.drawContinentGDPGraph(
+            continentData
+        ),
+        "figure.drawCountryCurveEvolution": lambda: draw_graph.drawCountryCurveEvolution(
+            countryData
+        ),
+        "figure.drawCountryPIBLiteratePopulation": lambda: draw_graph.drawCountryPIBLiteratePopulation(
+            countryData
+        ),
+    }
+
+
+def getCallbackBenchmarks() -> dict[str, Callable]:
+    # Full round trips through Dash's /_dash-update-component on the real dataset
+    config.PREWARM_FIGURE_CACHE = False
+    config.SPECULATIVE_PRECOMPUTE = False
+    config.USE_DISK_CACHE = False
+    import main
+
+    client = main.server.test_client()
+    yearInput = [{"id": "year-slider", "property": "value", "value": benchmarkYear}]
+    # The slider updates one graph per callback, a year change sends these three requests
+    updateYearRequests = [
+        {
+            "output": "..educationWorldMap.figure...educationWorldMapTitle.children"
+            "...mapDescription.children..",
+            "outputs": [
+                {"id": "educationWorldMap", "property": "figure"},
+                {"id": "educationWorldMapTitle", "property": "children"},
+                {"id": "mapDescription", "property": "children"},
+            ],
+            "inputs": yearInput,
+            "state": [{"id": "mapSchoolType", "property": "data", "value": True}],
+            "changedPropIds": ["year-slider.value"],
+        },
+        {
+            "output": "..bubbleGraph.figure...bubbleGraphTitle.children..",
+            "outputs": [
+                {"id": "bubbleGraph", "property": "figure"},
+                {"id": "bubbleGraphTitle", "property": "children"},
+            ],
+            "inputs": yearInput,
+            "changedPropIds": ["year-slider.value"],
+        },
+        {
+            "output": "..continentGDPGraph.figure...continentGDPGraphTitle.children..",
+            "outputs": [
+                {"id": "continentGDPGraph", "property": "figure"},
+                {"id": "continentGDPGraphTitle", "property": "children"},
+            ],
+            "inputs": yearInput,
+            "changedPropIds": ["year-slider.value"],
+        },
+    ]
+
+    def postUpdateYear() -> None:
+        for request in updateYearRequests:
+            response = client.post("/_dash-update-component", json=request)
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f"{request['output']} failed with {response.status_code}"
+                )
+
+    def postUncachedUpdateYear() -> None:
+        figure_cache.clearCaches()
+        postUpdateYear()
+
+    return {
+        "callback.updateYear": postUncachedUpdateYear,
+        "callback.updateYear.cached": postUpdateYear,
+    }
+
+
+def runCalibration() -> float:
+    # Minimum time of the calibration workload, in milliseconds, less noisy
+    # than the median for a workload that does not vary
+    random = np.random.default_rng(0)
+    values = random.uniform(0, 100, calibrationRows)
+    keys = random.integers(0, 1000, calibrationRows)
+
+    def calibrate() -> None:
+        np.sort(values)
+        pds.Series(values).groupby(keys).mean()
+        sum(value for value in values[: calibrationRows // 10].tolist())
+
+    return timeCall(calibrate, 9)["min_ms"]
+
+
+def runBenchmarks(scaleNames: list[str], repeat: int) -> dict[str, dict]:
+    baseData = store_data.readDataset(datasetPath)
+    baseCountries = store_data.readCountries(datasetPath)
+    results = {}
+    for scaleName in scaleNames:
+        countryFactor, yearFactor = scales[scaleName]
+        data, countries = (
+            (baseData, baseCountries)
+            if scaleName == "x1"
+            else makeSyntheticDataset(
+                baseData, baseCountries, countryFactor, yearFactor
+            )
+        )
+        benchmarks = {
+            **getDataBenchmarks(data, countries),
+            **getFigureBenchmarks(data, countries),
+        }
+        if scaleName == "x1":
+            benchmarks.update(getCallbackBenchmarks())
+        for name, function in benchmarks.items():
+            key = f"{name}[{scaleName}]"
+            results[key] = {**timeCall(function, repeat), "rows": len(data)}
+            print(f"{key:<58} {results[key]['median_ms']:>10.3f} ms", flush=True)
+        if scaleName == "x1":
+            key = f"{startupKey}[{scaleName}]"
+            results[key] = {**timeStartup(repeat), "rows": len(data)}
+            print(f"{key:<58} {results[key]['median_ms']:>10.3f} ms", flush=True)
+    return results
+
+
+def findRegressions(
+    results: dict[str, dict],
+    calibrationMs: float,
+    baseline: dict[str, dict],
+    baselineCalibrationMs: float | None,
+    threshold: float,
+) -> list[str]:
+    # A time is a regression when its ratio to the calibration time grew by
+    # more than threshold, or the time itself for a baseline without calibration
+    speedFactor = (
+        1 if baselineCalibrationMs is None else calibrationMs / baselineCalibrationMs
+    )
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        ratio = result["median_ms"] / (baseline[key]["median_ms"] * speedFactor)
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{key}: {baseline[key]['median_ms']:.3f} ms -> "
+                f"{result['median_ms']:.3f} ms (x{ratio:.2f} relative to the calibration)"
+            )
+    return regressions
+
+
+def findBudgetOverruns(results: dict[str, dict]) -> list[str]:
+    budget = config.STARTUP_TIME_BUDGET_SECONDS * 1000
+    return [
+        f"{key}: {result['median_ms']:.3f} ms > budget of {budget:.0f} ms"
+        for key, result in results.items()
+        if key.startswith(startupKey) and result["median_ms"] > budget
+    ]
+
+
+def writeResults(path: str, results: dict[str, dict], calibrationMs: float) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "calibration_ms": calibrationMs,
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "numpy": np.__version__,
+                "pandas": pds.__version__,
+                "results": results,
+            },
+            f,
+            indent=2,
+            sort_keys=True,
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of the dashboard data, figure and callback layers"
+    )
+    parser.add_argument(
+        "--scales", nargs="+", choices=list(scales), default=list(scales)
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="allowed slowdown over the baseline, relative to the calibration "
+        "(0.25 = 25%%)",
+    )
+    parser.add_argument("--output", default=resultsPath)
+    parser.add_argument("--baseline", default=baselinePath)
+    parser.add_argument("--save-baseline", action="store_true")
+    arguments = parser.parse_args()
+
+    calibrationMs = runCalibration()
+    print(f"{'calibration':<58} {calibrationMs:>10.3f} ms", flush=True)
+    results = runBenchmarks(arguments.scales, arguments.repeat)
+    writeResults(arguments.output, results, calibrationMs)
+    overruns = findBudgetOverruns(results)
+    for overrun in overruns:
+        print(f"OVER BUDGET {overrun}")
+    if arguments.save_baseline:
+        writeResults(arguments.baseline, results, calibrationMs)
+        return 1 if overruns else 0
+
+    if not os.path.exists(arguments.baseline):
+        print(f"No baseline found at {arguments.baseline}, run with --save-baseline")
+        return 1 if overruns else 0
+    with open(arguments.baseline, "r") as f:
+        baseline = json.load(f)
+    regressions = findRegressions(
+        results,
+        calibrationMs,
+        baseline["results"],
+        baseline.get("calibration_ms"),
+        arguments.threshold,
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions or overruns else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
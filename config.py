@@ -0,0 +1,38 @@
+# Maximum number of entries kept by each figure cache (least recently used are evicted)
+FIGURE_CACHE_SIZE = 256
+# Compute every year / map mode combination in the background at startup
+PREWARM_FIGURE_CACHE = True
+# After serving a year, compute the neighbouring years and the other map mode
+# in the background, waiting SPECULATION_DELAY_SECONDS before each of them
+SPECULATIVE_PRECOMPUTE = True
+SPECULATION_DELAY_SECONDS = 0.02
+# Results are also kept on disk, shared by every worker process and kept across
+# restarts, the least recently used files are removed above DISK_CACHE_MAX_BYTES
+USE_DISK_CACHE = True
+DISK_CACHE_DIRECTORY = "cache"
+DISK_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Check the cleaned dataset every DATASET_WATCH_SECONDS and switch to a new
+# version in the background, without restarting the app
+RELOAD_DATASET = True
+DATASET_WATCH_SECONDS = 10
+# Download the raw dataset again from Kaggle even if it is already in data/raw
+REFRESH_DATASET = False
+# Above this number of points the bubble chart is drawn with WebGL instead of SVG
+BUBBLE_WEBGL_THRESHOLD = 1000
+# Above this number of points the bubble chart shows a grid of aggregated bubbles
+BUBBLE_BINNING_THRESHOLD = 20000
+BUBBLE_BINS = 50
+# The first figure of each kind is drawn with plotly express and kept as a
+# template, the next ones only replace its data and skip the validation
+USE_FIGURE_TEMPLATES = True
+# The raw dataset is cleaned by chunks of this many rows, on this many processes
+CLEAN_CHUNK_ROWS = 100_000
+CLEAN_WORKERS = 1
+# Keep a cProfile dump in PROFILE_DIRECTORY of every callback slower than
+# SLOW_CALLBACK_SECONDS (profiling slows every callback down while enabled)
+PROFILE_SLOW_CALLBACKS = False
+SLOW_CALLBACK_SECONDS = 0.5
+PROFILE_DIRECTORY = "profiles"
+# Time main.py should take to be ready to serve, checked by the benchmarks
+# (worker respawns and new instances are not available before that)
+STARTUP_TIME_BUDGET_SECONDS = 2.0
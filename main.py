@@ -3,16 +3,28 @@
 #
 # Imports
 #
-import plotly_express as px
+import time
+
+startTime = time.perf_counter()
+
+import threading
 import plotly.graph_objects as go
-import pandas as pds
 import dash
 from dash import dcc
 from dash import html
-import dash_daq as daq
-import json
+from collections.abc import Callable
 from typing import Any
-from src.utils import draw_graph, format_graph_data, get_data, clean_data
+import config
+import flask
+from src.utils import (
+    disk_cache,
+    draw_graph,
+    format_graph_data,
+    figure_cache,
+    metrics,
+    pipeline,
+    store_data,
+)
 
 
 #  iris.rename(columns={   "sepal.length": "sepal_length",
@@ -20,71 +32,409 @@ from src.utils import draw_graph, format_graph_data, get_data, clean_data
 #                     "petal.length": "petal_length",
 #                     "petal.width": "petal_width"},
 #                         inplace = True)
-get_data.downloadDataset()
-clean_data.cleanDataset()
+pipeline.prepareDataset(config.REFRESH_DATASET)
 
-with open("data/cleaned/countries.geo.json", "r") as f:
-    countries = json.load(f)
+# Default values, the state of each user session is then kept by the components
+sliderYears = range(1999, 2024)
+defaultYear = 2020
+defaultCountryName = "France"
+defaultDisplayPrimaryOnMap = True
 
-# Default values
-year = 2020
-country_name = "France"
-displayPrimaryOnMap = True
+datasetDirectory = pipeline.outputFiles[0]
+countriesAssetPath = pipeline.outputFiles[1]
 
-worldEducation = pds.read_csv("data/cleaned/cleaned-world-education-data.csv")
 
-correlationData = format_graph_data.getCorrelationData(worldEducation)
-continentEducationData = format_graph_data.getContinentEducationData(
-    worldEducation, year
-)
-worldEducationForMap, maxPupilTeacher = format_graph_data.getMapData(
-    worldEducation, year, displayPrimaryOnMap
+class DashboardData:
+    # The cleaned dataset and everything derived from it. Callbacks read the
+    # current instance once and pass it to the cached functions (it is part of
+    # their keys), so a reload can replace it while they are running.
+    def __init__(
+        self, version: str | None, previous: "DashboardData | None" = None
+    ) -> None:
+        # previous is the version being replaced, whose unchanged parts are reused
+        self.version = version
+        self.worldEducation = store_data.readDataset(
+            datasetDirectory,
+            columns=[
+                "country_id",
+                "country",
+                "country_code",
+                "Continent_Name",
+                "year",
+                *format_graph_data.indicatorColumns,
+            ],
+        )
+        # Name, ISO3 code, continent and map feature of each country key
+        self.countries = store_data.readCountries(datasetDirectory)
+        # The map geometry written with this dataset, see getCountriesUrl
+        self.countriesVersion = pipeline.hashFile(countriesAssetPath)
+        # Latest known value of every indicator per country and year, used by the slider
+        self.worldEducationCube = format_graph_data.buildAsOfCube(
+            self.worldEducation, self.countries
+        )
+        # Statistics of every indicator per continent and for the world, per year
+        self.worldEducationRollups = format_graph_data.buildRollups(
+            self.worldEducationCube,
+            previous.worldEducationCube if previous is not None else None,
+            previous.worldEducationRollups if previous is not None else None,
+        )
+        # Contiguous rows of each country key, with the key of each name and ISO3 code
+        self.worldEducationByCountry = format_graph_data.buildCountryIndex(
+            self.worldEducation, self.countries
+        )
+        # Correlation matrices of the indicators for any year range / continent subset
+        self.getCorrelationData = format_graph_data.buildCorrelationEngine(
+            self.worldEducation, version
+        )
+
+    def __repr__(self) -> str:
+        # Used in the keys of the disk cache, the map figures hold the geometry URL
+        return f"DashboardData({self.version}, {self.countriesVersion})"
+
+
+dashboardData = DashboardData(pipeline.hashFile(datasetDirectory))
+
+# Results of the shared disk cache are only reused for the same code, the
+# dataset version is part of each key through DashboardData
+disk_cache.setVersion(
+    *(
+        pipeline.hashFile(path)
+        for path in [
+            "main.py",
+            "config.py",
+            "src/utils/draw_graph.py",
+            "src/utils/format_graph_data.py",
+        ]
+    ),
 )
-bubbleData = format_graph_data.getBubbleData(worldEducation, year)
-countryEducationData = worldEducation[worldEducation["country"] == country_name]
 
 
-app = dash.Dash(__name__)
+# Responses are gzip or brotli compressed depending on what the browser accepts.
+# Dash serializes them with orjson when it is installed.
+app = dash.Dash(__name__, compress=True)
+# WSGI entry point, e.g. gunicorn --workers 4 --threads 4 main:server
+server = app.server
+# The map geometry is fetched once by the browser as a static asset instead of
+# being embedded in every map figure
+app.server.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400
+countries = app.get_asset_url("countries.geo.json")
+
+
+def getCountriesUrl(data: DashboardData) -> str:
+    # The hash of the geometry is in the URL, so that the browsers cache it
+    # for a day but fetch it again once a new dataset rewrites it
+    return f"{countries}?v={data.countriesVersion[:16]}"
+
+
+# region cached graphs
+# The layout is served without any figure, each graph is drawn in full by the
+# initial call of its callback (shouldPatch=False) and then partially updated.
+# shouldPatch is always passed, the cache keys are the positional arguments.
+
+
+@figure_cache.memoize("educationWorldMap")
+def getEducationWorldMap(
+    data: DashboardData, year: int, displayPrimary: bool, shouldPatch: bool
+) -> dash.Patch | dict[str, Any]:
+    with metrics.measurePhase("data"):
+        worldEducationForMap, maxPupilTeacher = format_graph_data.getMapDataFromCube(
+            data.worldEducationCube, year, displayPrimary
+        )
+    with metrics.measurePhase("figure"):
+        if not shouldPatch:
+            return draw_graph.encodeFigure(
+                draw_graph.drawEducationWorldMap(
+                    worldEducationForMap,
+                    getCountriesUrl(data),
+                    displayPrimary,
+                    maxPupilTeacher,
+                )
+            )
+        return draw_graph.patchEducationWorldMap(
+            worldEducationForMap, displayPrimary, maxPupilTeacher
+        )
+
+
+@figure_cache.memoize("bubbleGraph")
+def getBubbleGraph(
+    data: DashboardData, year: int, shouldPatch: bool
+) -> dash.Patch | go.Figure | dict[str, Any]:
+    with metrics.measurePhase("data"):
+        bubbleData = format_graph_data.getBubbleData(data.worldEducation, year)
+    with metrics.measurePhase("figure"):
+        if not shouldPatch:
+            return draw_graph.encodeFigure(draw_graph.drawBubbleGraph(bubbleData))
+        return draw_graph.patchBubbleGraph(bubbleData)
+
+
+@figure_cache.memoize("continentGDPGraph")
+def getContinentGDPGraph(
+    data: DashboardData, year: int, shouldPatch: bool
+) -> dash.Patch | go.Figure | dict[str, Any]:
+    with metrics.measurePhase("data"):
+        continentEducationData = (
+            format_graph_data.getContinentEducationDataFromRollups(
+                data.worldEducationRollups, year
+            )
+        )
+    with metrics.measurePhase("figure"):
+        if not shouldPatch:
+            return draw_graph.encodeFigure(
+                draw_graph.drawContinentGDPGraph(continentEducationData)
+            )
+        return draw_graph.patchContinentGDPGraph(continentEducationData)
+
+
+@figure_cache.memoize("heatmap")
+def getHeatMap(data: DashboardData, shouldDisplayText: bool) -> dict[str, Any]:
+    with metrics.measurePhase("data"):
+        correlationData = data.getCorrelationData()
+    with metrics.measurePhase("figure"):
+        return draw_graph.encodeFigure(
+            draw_graph.drawHeatMap(correlationData, shouldDisplayText)
+        )
+
+
+@figure_cache.memoize("countryGraphs")
+def getCountryGraphs(
+    data: DashboardData, countryKey: int | None
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    with metrics.measurePhase("data"):
+        countryEducationData = format_graph_data.getCountryData(
+            data.worldEducationByCountry, countryKey
+        )
+    with metrics.measurePhase("figure"):
+        return (
+            draw_graph.encodeFigure(
+                draw_graph.drawCountryCurveEvolution(countryEducationData)
+            ),
+            draw_graph.encodeFigure(
+                draw_graph.drawCountryPIBLiteratePopulation(countryEducationData)
+            ),
+        )
+
+
+@figure_cache.memoize("animations")
+def getAnimations(
+    data: DashboardData, displayPrimary: bool
+) -> tuple[dict[str, Any], dict[str, Any]]:
+    # Every year of the map and of the bubble chart as animation frames
+    with metrics.measurePhase("data"):
+        mapAnimationData, maxPupilTeacher = format_graph_data.getMapAnimationData(
+            data.worldEducationCube, displayPrimary
+        )
+        bubbleAnimationData = format_graph_data.getBubbleAnimationData(
+            data.worldEducation, sliderYears
+        )
+    with metrics.measurePhase("figure"):
+        return (
+            draw_graph.encodeFigure(
+                draw_graph.drawEducationWorldMap(
+                    mapAnimationData,
+                    getCountriesUrl(data),
+                    displayPrimary,
+                    maxPupilTeacher,
+                    isAnimated=True,
+                )
+            ),
+            draw_graph.encodeFigure(
+                draw_graph.drawBubbleGraph(bubbleAnimationData, isAnimated=True)
+            ),
+        )
+
+
+def getNeighbourYears(year: int) -> list[int]:
+    # Years one slider step away, the most likely to be asked next
+    return [neighbour for neighbour in (year + 1, year - 1) if neighbour in sliderYears]
+
+
+# The next requests are slider moves or map button clicks, both answered with
+# a partial update: the arguments are those of their callbacks (shouldPatch=True)
+
+
+def speculateEducationWorldMap(
+    data: DashboardData, year: int, displayPrimary: bool
+) -> None:
+    if config.SPECULATIVE_PRECOMPUTE:
+        figure_cache.speculate(
+            "educationWorldMap",
+            getEducationWorldMap,
+            [
+                (data, neighbour, displayPrimary, True)
+                for neighbour in getNeighbourYears(year)
+            ]
+            + [(data, year, not displayPrimary, True)],
+        )
+
+
+def speculateYearGraph(
+    name: str, cachedFunction: Callable, data: DashboardData, year: int
+) -> None:
+    if config.SPECULATIVE_PRECOMPUTE:
+        figure_cache.speculate(
+            name,
+            cachedFunction,
+            [(data, neighbour, True) for neighbour in getNeighbourYears(year)],
+        )
+
+
+def drawFirstPageLoad(data: DashboardData) -> None:
+    # Figures returned by the initial callbacks of a new page
+    getHeatMap(data, False)
+    getContinentGDPGraph(data, defaultYear, False)
+    getBubbleGraph(data, defaultYear, False)
+    getEducationWorldMap(data, defaultYear, defaultDisplayPrimaryOnMap, False)
+    getCountryGraphs(
+        data,
+        format_graph_data.getCountryKey(data.worldEducationByCountry, defaultCountryName),
+    )
+
+
+def drawPrewarmedFigures(data: DashboardData) -> None:
+    # The first page load, then the partial updates sent when the slider moves.
+    # One process at a time: the first one computes the figures and writes
+    # them to the disk cache shared by the workers, the next ones read them.
+    with pipeline.lockFile(pipeline.prewarmLockPath):
+        drawFirstPageLoad(data)
+        for year in sliderYears:
+            for displayPrimary in (True, False):
+                getEducationWorldMap(data, year, displayPrimary, True)
+            getBubbleGraph(data, year, True)
+            getContinentGDPGraph(data, year, True)
+
+
+def prewarmCaches(
+    data: DashboardData, background: bool
+) -> threading.Thread | None:
+    return figure_cache.prewarm(drawPrewarmedFigures, [(data,)], background)
+
+
+if config.PREWARM_FIGURE_CACHE:
+    prewarmCaches(dashboardData, background=True)
+
+
+def reloadDashboardData() -> None:
+    # Everything is built and the caches are filled for the new dataset before
+    # it replaces the current one: callbacks already running end with the
+    # previous version and the next ones get the new one, fully computed.
+    # The results of the previous version are then evicted from the caches so
+    # that it can be freed, those added later by the callbacks still running
+    # with it leave the caches as the least recently used.
+    global dashboardData
+    version = pipeline.hashFile(datasetDirectory)
+    if version == dashboardData.version:
+        return
+    newDashboardData = DashboardData(version, dashboardData)
+    # Every worker watches the dataset and builds its own DashboardData, the
+    # figures are only computed by the first one to prewarm (see drawPrewarmedFigures)
+    if config.PREWARM_FIGURE_CACHE:
+        prewarmCaches(newDashboardData, background=False)
+    dashboardData = newDashboardData
+    figure_cache.evict(
+        lambda arguments: isinstance(
+            arguments[0], (DashboardData, format_graph_data.CorrelationEngine)
+        )
+        and arguments[0] is not newDashboardData
+        and arguments[0] is not newDashboardData.getCorrelationData
+    )
+
+
+if config.RELOAD_DATASET:
+    pipeline.watchFiles(
+        datasetDirectory, reloadDashboardData, config.DATASET_WATCH_SECONDS
+    )
+
+
+@app.server.route("/cache-stats")
+def cacheStatistics() -> dict[str, dict[str, int]]:
+    return figure_cache.getCacheStatistics()
+
+
+# Latency of each callback phase and response sizes, in the Prometheus format
+app.server.after_request(metrics.recordEncoding)
+
+
+@app.server.route("/metrics")
+def metricsEndpoint() -> flask.Response:
+    return flask.Response(
+        metrics.renderMetrics(), mimetype="text/plain; version=0.0.4"
+    )
+
+
+# endregion
 
 
 # region callaback functions
+# Each graph of the slider has its own callback: the browser sends one request
+# per graph, they run concurrently (threads or workers of the server) and each
+# graph is redrawn as soon as its own response arrives.
 @app.callback(
     [
         dash.Output(component_id="educationWorldMap", component_property="figure"),
-        dash.Output(component_id="bubbleGraph", component_property="figure"),
-        dash.Output(component_id="continentGDPGraph", component_property="figure"),
-        dash.Output(component_id="continentGDPGraphTitle", component_property="children"),
-        dash.Output(component_id="bubbleGraphTitle", component_property="children"),
         dash.Output(component_id="educationWorldMapTitle", component_property="children"),
         dash.Output(component_id="mapDescription", component_property="children"),
     ],
     [dash.Input(component_id="year-slider", component_property="value")],
+    [dash.State(component_id="mapSchoolType", component_property="data")],
 )
-def updateYear(input_value: int) -> list[go.Figure]:
-    global displayPrimaryOnMap, worldEducationForMap, maxPupilTeacher, bubbleData, continentEducationData, year
-
-    year = input_value
-
-    bubbleData = format_graph_data.getBubbleData(worldEducation, year)
-    worldEducationForMap, maxPupilTeacher = format_graph_data.getMapData(
-        worldEducation, year, displayPrimaryOnMap
-    )
-    continentEducationData = format_graph_data.getContinentEducationData(
-        worldEducation, year
+@metrics.instrumentCallback
+def updateEducationWorldMap(
+    year: int, displayPrimaryOnMap: bool
+) -> list[dash.Patch | dict[str, Any] | str]:
+    # Nothing triggers the initial call, the graph is still empty then
+    shouldPatch = dash.ctx.triggered_id is not None
+    data = dashboardData
+    educationWorldMap = getEducationWorldMap(
+        data, year, displayPrimaryOnMap, shouldPatch
     )
+    speculateEducationWorldMap(data, year, displayPrimaryOnMap)
     return [
-        draw_graph.drawEducationWorldMap(
-            worldEducationForMap, countries, displayPrimaryOnMap, maxPupilTeacher
-        ),
-        draw_graph.drawBubbleGraph(bubbleData),
-        draw_graph.drawContinentGDPGraph(continentEducationData),
-        f"Investissements moyens dans l'éducation par continent ({year})",
-        f"Accès à la scolarisation primaire (et réussite) par pays ({year})",
+        educationWorldMap,
         f"Nombre moyen d'élèves par professeur en {'primaire' if displayPrimaryOnMap else 'secondaire'} par pays ({year})",
         f"La carte ci-dessous montre le nombre moyen d'élèves par professeurs dans les différents pays. Pour les pays n'ayant pas de données en {year}, nous prenons les données les plus récentes en {year}."
     ]
 
 
+@app.callback(
+    [
+        dash.Output(component_id="bubbleGraph", component_property="figure"),
+        dash.Output(component_id="bubbleGraphTitle", component_property="children"),
+    ],
+    dash.Input(component_id="year-slider", component_property="value"),
+)
+@metrics.instrumentCallback
+def updateBubbleGraph(year: int) -> list[go.Figure | dash.Patch | dict[str, Any] | str]:
+    shouldPatch = dash.ctx.triggered_id is not None
+    data = dashboardData
+    bubbleGraph = getBubbleGraph(data, year, shouldPatch)
+    speculateYearGraph("bubbleGraph", getBubbleGraph, data, year)
+    return [
+        bubbleGraph,
+        f"Accès à la scolarisation primaire (et réussite) par pays ({year})",
+    ]
+
+
+@app.callback(
+    [
+        dash.Output(component_id="continentGDPGraph", component_property="figure"),
+        dash.Output(component_id="continentGDPGraphTitle", component_property="children"),
+    ],
+    dash.Input(component_id="year-slider", component_property="value"),
+)
+@metrics.instrumentCallback
+def updateContinentGDPGraph(
+    year: int,
+) -> list[go.Figure | dash.Patch | dict[str, Any] | str]:
+    shouldPatch = dash.ctx.triggered_id is not None
+    data = dashboardData
+    continentGDPGraph = getContinentGDPGraph(data, year, shouldPatch)
+    speculateYearGraph("continentGDPGraph", getContinentGDPGraph, data, year)
+    return [
+        continentGDPGraph,
+        f"Investissements moyens dans l'éducation par continent ({year})",
+    ]
+
+
 @app.callback(
     [
         dash.Output(
@@ -97,26 +447,26 @@ def updateYear(input_value: int) -> list[go.Figure]:
             component_property="children",
             allow_duplicate=True,
         ),
+        dash.Output(component_id="mapSchoolType", component_property="data"),
     ],[
         dash.Input(component_id="map-button-elementary", component_property="n_clicks"),
         dash.Input(component_id="map-button-secondary", component_property="n_clicks"),
     ],
+    [dash.State(component_id="year-slider", component_property="value")],
     prevent_initial_call=True,
 )
-def changeMapSchoolType(elementary_button: str, secondary_button: str) -> list[go.Figure]:
-    global displayPrimaryOnMap, worldEducationForMap, year
-    if "map-button-elementary" == dash.ctx.triggered_id:
-        displayPrimaryOnMap = True
-    elif "map-button-secondary" == dash.ctx.triggered_id:
-        displayPrimaryOnMap = False
-    worldEducationForMap, maxPupilTeacher = format_graph_data.getMapData(
-        worldEducation, year, displayPrimaryOnMap
-    )
+@metrics.instrumentCallback
+def changeMapSchoolType(
+    elementary_button: str, secondary_button: str, year: int
+) -> list[dash.Patch | str | bool]:
+    displayPrimaryOnMap = "map-button-secondary" != dash.ctx.triggered_id
+    data = dashboardData
+    educationWorldMap = getEducationWorldMap(data, year, displayPrimaryOnMap, True)
+    speculateEducationWorldMap(data, year, displayPrimaryOnMap)
     return [
-        draw_graph.drawEducationWorldMap(
-            worldEducationForMap, countries, displayPrimaryOnMap, maxPupilTeacher
-        ),
+        educationWorldMap,
         f"Nombre moyen d'élèves par professeur en {'primaire' if displayPrimaryOnMap else 'secondaire'} par pays ({year})",
+        displayPrimaryOnMap,
     ]
 
 
@@ -124,8 +474,53 @@ def changeMapSchoolType(elementary_button: str, secondary_button: str) -> list[g
     dash.Output(component_id="heatmap", component_property="figure"),
     dash.Input(component_id="heatmap-switch", component_property="on"),
 )
-def ToggleHeatMapText(on: bool) -> go.Figure:
-    return px.imshow(correlationData, text_auto=on, labels={"color": "Corrélation"})
+@metrics.instrumentCallback
+def ToggleHeatMapText(on: bool) -> dash.Patch | dict[str, Any]:
+    if dash.ctx.triggered_id is None:
+        return getHeatMap(dashboardData, on)
+    return draw_graph.patchHeatMapText(on)
+
+
+@app.callback(
+    dash.Output(
+        component_id="heatmap", component_property="figure", allow_duplicate=True
+    ),
+    [
+        dash.Input(component_id="heatmap-year-range", component_property="value"),
+        dash.Input(component_id="heatmap-continents", component_property="value"),
+    ],
+    prevent_initial_call=True,
+)
+@metrics.instrumentCallback
+def filterHeatMap(yearRange: list[int], continentNames: list[str]) -> dash.Patch:
+    # The unfiltered matrix is asked without filters so it shares its cache entry
+    if yearRange == [sliderYears[0], sliderYears[-1]]:
+        yearRange = None
+    if set(continentNames) == set(draw_graph.continent_colors):
+        continentNames = None
+    return draw_graph.patchHeatMapData(
+        dashboardData.getCorrelationData(yearRange, continentNames)
+    )
+
+
+@app.callback(
+    [
+        dash.Output(
+            component_id="educationWorldMapAnimation", component_property="figure"
+        ),
+        dash.Output(component_id="bubbleGraphAnimation", component_property="figure"),
+        dash.Output(component_id="animations", component_property="hidden"),
+    ],
+    dash.Input(component_id="animation-button", component_property="n_clicks"),
+    dash.State(component_id="mapSchoolType", component_property="data"),
+    prevent_initial_call=True,
+)
+@metrics.instrumentCallback
+def showAnimations(
+    n_clicks: int, displayPrimaryOnMap: bool
+) -> list[dict[str, Any] | bool]:
+    # The playback then runs in the browser without any other request
+    return [*getAnimations(dashboardData, displayPrimaryOnMap), False]
 
 
 # Now create the graph that updates the country name based on hover and showing Years on x-axis and Display value
@@ -142,37 +537,36 @@ def ToggleHeatMapText(on: bool) -> go.Figure:
     ],
     dash.Input(component_id="educationWorldMap", component_property="clickData"),
 )
-def updateCountryBasedGraph(clickData: dict[str, Any]) -> list[go.Figure]:
-    global country_name, countryEducationData
+@metrics.instrumentCallback
+def updateCountryBasedGraph(clickData: dict[str, Any]) -> list[dict[str, Any] | str]:
+    data = dashboardData
+    country_name = defaultCountryName
     if clickData is not None:
         country_name = clickData["points"][0]["hovertext"]
-        countryEducationData = worldEducation[worldEducation["country"] == country_name]
+    countryKey = format_graph_data.getCountryKey(
+        data.worldEducationByCountry, country_name
+    )
 
     return [
-        draw_graph.drawCountryCurveEvolution(countryEducationData),
-        draw_graph.drawCountryPIBLiteratePopulation(countryEducationData),
+        *getCountryGraphs(data, countryKey),
         f"Graphiques du pays : {country_name}",
     ]
 
 
 # endregion
 
-if __name__ == "__main__":
-    bubbleGraph = draw_graph.drawBubbleGraph(bubbleData)
-    heatmap = px.imshow(
-        correlationData, text_auto=False, labels={"color": "Corrélation"}
-    )
-    educationWorldMap = draw_graph.drawEducationWorldMap(
-        worldEducationForMap, countries, displayPrimaryOnMap, maxPupilTeacher
-    )
-    continentGDPGraph = draw_graph.drawContinentGDPGraph(continentEducationData)
+def buildLayout() -> html.Div:
+    # Only the components are built here, the figures come from the initial
+    # callbacks on the first request so that startup does not wait for them.
+    # dash_daq is only needed by the layout, imported here as plotly_express
+    # is in the draw functions
+    import dash_daq as daq
 
-    countryCurveEvolution = draw_graph.drawCountryCurveEvolution(countryEducationData)
-    countryPIBLiteratePopulation = draw_graph.drawCountryPIBLiteratePopulation(
-        countryEducationData
-    )
+    year = defaultYear
+    country_name = defaultCountryName
+    displayPrimaryOnMap = defaultDisplayPrimaryOnMap
 
-    app.layout = html.Div(
+    return html.Div(
         children=[
             ######### Titre de la page #########
             html.Div(
@@ -206,12 +600,29 @@ if __name__ == "__main__":
                             ),
                             dcc.Loading(
                                 [
-                                    dcc.Graph(id="heatmap", figure=heatmap),
+                                    dcc.Graph(id="heatmap"),
                                     daq.BooleanSwitch(
                                         id="heatmap-switch",
                                         on=False,
                                         label="Afficher les valeurs",
                                     ),
+                                    dcc.RangeSlider(
+                                        id="heatmap-year-range",
+                                        min=sliderYears[0],
+                                        max=sliderYears[-1],
+                                        step=1,
+                                        marks={
+                                            year: str(year)
+                                            for year in sliderYears[::4]
+                                        },
+                                        value=[sliderYears[0], sliderYears[-1]],
+                                    ),
+                                    dcc.Checklist(
+                                        id="heatmap-continents",
+                                        options=list(draw_graph.continent_colors),
+                                        value=list(draw_graph.continent_colors),
+                                        inline=True,
+                                    ),
                                 ],
                                 type="default",
                                 overlay_style={
@@ -238,9 +649,7 @@ if __name__ == "__main__":
                                 """
                             ),
                             dcc.Loading(
-                                dcc.Graph(
-                                    id="continentGDPGraph", figure=continentGDPGraph
-                                ),
+                                dcc.Graph(id="continentGDPGraph"),
                                 type="default",
                                 overlay_style={
                                     "visibility": "visible",
@@ -263,10 +672,10 @@ if __name__ == "__main__":
                         children=[
                             dcc.Slider(
                                 id="year-slider",
-                                min=1999,
-                                max=2023,
+                                min=sliderYears[0],
+                                max=sliderYears[-1],
                                 step=1,
-                                marks={year: str(year) for year in range(1999, 2024)},
+                                marks={year: str(year) for year in sliderYears},
                                 value=year,  # Année sélectionnée par défaut
                             ),
                         ],
@@ -290,7 +699,7 @@ if __name__ == "__main__":
                                 """
                             ),
                             dcc.Loading(
-                                dcc.Graph(id="bubbleGraph", figure=bubbleGraph),
+                                dcc.Graph(id="bubbleGraph"),
                                 type="default",
                                 overlay_style={
                                     "visibility": "visible",
@@ -336,13 +745,55 @@ if __name__ == "__main__":
                                         children="Secondaire",
                                         className="button",
                                     ),
+                                    # Map mode selected by the user (True for primary)
+                                    dcc.Store(
+                                        id="mapSchoolType",
+                                        data=displayPrimaryOnMap,
+                                    ),
+                                ],
+                                className="buttons",
+                            ),
+                            dcc.Loading(
+                                dcc.Graph(id="educationWorldMap"),
+                                type="default",
+                                overlay_style={
+                                    "visibility": "visible",
+                                    "opacity": 0.5,
+                                    "backgroundColor": "white",
+                                },
+                            ),
+                        ],
+                        className="paragraph",
+                    ),
+                    html.Div(
+                        children=[
+                            html.H3(
+                                children=f"Évolution de {sliderYears[0]} à {sliderYears[-1]}",
+                                className="section-title",
+                            ),
+                            html.Div(
+                                children=f"""
+                                    Le bouton ci-dessous charge en une seule fois toutes les années de la carte (pour le cycle choisi au-dessus) et du graphique à bulles. Le bouton lecture de chaque graphique fait ensuite défiler les années.
+                                """
+                            ),
+                            html.Div(
+                                children=[
+                                    html.Button(
+                                        id="animation-button",
+                                        children="Charger l'animation",
+                                        className="button",
+                                    ),
                                 ],
                                 className="buttons",
                             ),
                             dcc.Loading(
-                                dcc.Graph(
-                                    id="educationWorldMap",
-                                    figure=educationWorldMap,
+                                html.Div(
+                                    children=[
+                                        dcc.Graph(id="educationWorldMapAnimation"),
+                                        dcc.Graph(id="bubbleGraphAnimation"),
+                                    ],
+                                    id="animations",
+                                    hidden=True,
                                 ),
                                 type="default",
                                 overlay_style={
@@ -371,10 +822,7 @@ if __name__ == "__main__":
                                 className="section-title",
                             ),
                             dcc.Loading(
-                                dcc.Graph(
-                                    id="countryCurveEvolution",
-                                    figure=countryCurveEvolution,
-                                ),
+                                dcc.Graph(id="countryCurveEvolution"),
                                 type="default",
                                 overlay_style={
                                     "visibility": "visible",
@@ -392,10 +840,7 @@ if __name__ == "__main__":
                                 className="section-title",
                             ),
                             dcc.Loading(
-                                dcc.Graph(
-                                    id="countryPIBLiteratePopulation",
-                                    figure=countryPIBLiteratePopulation,
-                                ),
+                                dcc.Graph(id="countryPIBLiteratePopulation"),
                                 type="default",
                                 overlay_style={
                                     "visibility": "visible",
@@ -413,4 +858,9 @@ if __name__ == "__main__":
         className="cont",
     )
 
+
+app.layout = buildLayout()
+metrics.recordStartup(time.perf_counter() - startTime)
+
+if __name__ == "__main__":
     app.run_server(debug=True)
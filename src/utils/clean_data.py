@@ -1,18 +1,262 @@
+import functools
+import json
+import os
+import tempfile
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 import pandas as pds
+from typing import Any
+import config
+from src.utils import format_graph_data, store_data
 
+# Simplification tolerance and rounding applied to the map polygons, in degrees
+geoJsonTolerance = 0.1
+geoJsonDecimals = 2
 
-def cleanDataset() -> None:
-    # Add continent informations to the default dataset
-    rawCountryContinentData = pds.read_csv(
-        "data/raw/country-and-continent-codes-list.csv"
+
+def cleanChunk(
+    rawWorldEducationData: pds.DataFrame, countryCodes: pds.Index
+) -> pds.DataFrame:
+    # Replace the country code of a chunk of the default dataset by the key of
+    # the country in countryCodes, countries without one (regions, income
+    # groups...) are dropped
+    countryKeys = countryCodes.get_indexer(rawWorldEducationData["country_code"])
+    cleanWorldEducationData = rawWorldEducationData.assign(
+        **{store_data.countryKeyColumn: countryKeys}
+    ).drop(columns="country_code")[countryKeys >= 0]
+    return cleanWorldEducationData.astype(
+        {
+            "year": store_data.yearType,
+            **{
+                columnName: store_data.indicatorType
+                for columnName in format_graph_data.indicatorColumns
+            },
+        }
+    )
+
+
+# Indicators of the World Bank WDI files (wide layout) kept for the dashboard
+wdiIndicatorCodes = {
+    "SE.XPD.TOTL.GD.ZS": "gov_exp_pct_gdp",
+    "SE.ADT.LITR.ZS": "lit_rate_adult_pct",
+    "SE.PRM.CMPT.ZS": "pri_comp_rate_pct",
+    "SE.PRM.ENRL.TC.ZS": "pupil_teacher_primary",
+    "SE.SEC.ENRL.TC.ZS": "pupil_teacher_secondary",
+    "SE.PRM.ENRR": "school_enrol_primary_pct",
+    "SE.SEC.ENRR": "school_enrol_secondary_pct",
+    "SE.TER.ENRR": "school_enrol_tertiary_pct",
+}
+wdiKeyColumns = ["Country Name", "Country Code", "Indicator Code"]
+
+
+def meltWideChunk(rawWideData: pds.DataFrame) -> pds.DataFrame:
+    # Turn a chunk of the wide layout (one row per country and indicator, one
+    # column per year) into the layout of the default dataset (one row per
+    # country and year, one column per indicator). The chunk must hold all the
+    # rows of its countries, see readWideChunks.
+    longData = rawWideData.melt(
+        id_vars=wdiKeyColumns, var_name="year", value_name="value"
+    ).dropna(subset=["value"])
+    longData["year"] = longData["year"].astype(int)
+    wideData = longData.pivot(
+        index=["Country Name", "Country Code", "year"],
+        columns="Indicator Code",
+        values="value",
+    )
+    wideData = wideData.rename(columns=wdiIndicatorCodes).reindex(
+        columns=format_graph_data.indicatorColumns
+    )
+    return (
+        wideData.reset_index()
+        .rename(columns={"Country Name": "country", "Country Code": "country_code"})
+        .rename_axis(columns=None)
+    )
+
+
+def cleanWideChunk(
+    rawWideData: pds.DataFrame, countryCodes: pds.Index
+) -> pds.DataFrame:
+    return cleanChunk(meltWideChunk(rawWideData), countryCodes)
+
+
+def readWideChunks(path: str, chunkRows: int) -> Iterator[pds.DataFrame]:
+    # Chunks of about chunkRows rows of a file in the wide layout, with only
+    # the charted indicators. The rows of a country are contiguous in these
+    # files but may be split between two chunks of the reader: the rows of the
+    # last country of a chunk are held back and sent with the next one.
+    header = pds.read_csv(path, nrows=0).columns
+    yearColumns = [columnName for columnName in header if columnName.isdigit()]
+    rawChunks = pds.read_csv(
+        path, usecols=[*wdiKeyColumns, *yearColumns], chunksize=chunkRows
     )
-    rawWorldEducationData = pds.read_csv("data/raw/world-education-data.csv")
-    cleanWorldEducationData = pds.merge(
-        rawWorldEducationData,
-        rawCountryContinentData[["Continent_Name", "Three_Letter_Country_Code"]],
-        left_on="country_code",
-        right_on="Three_Letter_Country_Code",
+    heldRows = None
+    for rawChunk in rawChunks:
+        rawChunk = rawChunk[rawChunk["Indicator Code"].isin(wdiIndicatorCodes)]
+        if heldRows is not None:
+            rawChunk = pds.concat([heldRows, rawChunk])
+        if rawChunk.empty:
+            continue
+        isLastCountry = (
+            rawChunk["Country Code"] == rawChunk["Country Code"].iloc[-1]
+        ).to_numpy()
+        heldRows = rawChunk[isLastCountry]
+        if not isLastCountry.all():
+            yield rawChunk[~isLastCountry]
+    if heldRows is not None and not heldRows.empty:
+        yield heldRows
+
+
+def mapChunks(
+    function: Callable[[pds.DataFrame], pds.DataFrame],
+    chunks: Iterator[pds.DataFrame],
+    workers: int,
+) -> Iterator[pds.DataFrame]:
+    # Apply function to every chunk, in order, on several processes if asked.
+    # Only a few chunks per worker are in flight so memory use stays bounded.
+    if workers <= 1:
+        yield from map(function, chunks)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(function, chunk))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def cleanDataset(
+    chunkRows: int = config.CLEAN_CHUNK_ROWS, workers: int = config.CLEAN_WORKERS
+) -> None:
+    # Stream the raw dataset by chunks of chunkRows rows, only the charted
+    # indicators are read and the cleaned chunks are appended to the output.
+    # The raw dataset is either the default one or a World Bank WDI file.
+    rawCountryContinentData = pds.read_csv(
+        "data/raw/country-and-continent-codes-list.csv",
+        usecols=["Continent_Name", "Three_Letter_Country_Code"],
+    ).dropna()
+    # Countries that can be charted, their position in this table is the key
+    # used by the cleaned chunks
+    countries = (
+        rawCountryContinentData.drop_duplicates(subset="Three_Letter_Country_Code")
+        .rename(columns={"Three_Letter_Country_Code": "country_code"})
+        .reset_index(drop=True)
     )
-    cleanWorldEducationData.to_csv(
-        "data/cleaned/cleaned-world-education-data.csv", index=False
+    rawPath = "data/raw/world-education-data.csv"
+    countryCodes = pds.Index(countries["country_code"])
+    # The default dataset has one row per country and year, the files of the
+    # World Bank (WDI) one row per country and indicator
+    if "Indicator Code" in pds.read_csv(rawPath, nrows=0).columns:
+        rawWorldEducationChunks = readWideChunks(rawPath, chunkRows)
+        cleanRawChunk = functools.partial(cleanWideChunk, countryCodes=countryCodes)
+    else:
+        rawWorldEducationChunks = pds.read_csv(
+            rawPath,
+            usecols=[
+                "country",
+                "country_code",
+                "year",
+                *format_graph_data.indicatorColumns,
+            ],
+            chunksize=chunkRows,
+        )
+        cleanRawChunk = functools.partial(cleanChunk, countryCodes=countryCodes)
+
+    writer = store_data.DatasetWriter("data/cleaned/world-education-data", countries)
+    for cleanWorldEducationData in mapChunks(
+        cleanRawChunk, rawWorldEducationChunks, workers
+    ):
+        writer.append(cleanWorldEducationData)
+
+    # The map only has the countries of the dataset, the dimension table gives
+    # the index of their feature (-1 for the ones without polygons)
+    cleanCountries = cleanGeoJson(set(writer.getCountries()["country_code"]))
+    featureIndexes = {
+        feature["id"]: featureIndex
+        for featureIndex, feature in enumerate(cleanCountries["features"])
+    }
+    writer.countries = writer.countries.assign(
+        feature_index=[
+            featureIndexes.get(countryCode, -1)
+            for countryCode in writer.countries["country_code"]
+        ]
     )
+    writer.close()
+
+
+def simplifyRing(ring: list[list[float]]) -> list[list[float]]:
+    # Douglas-Peucker simplification of a closed ring, then coordinate rounding
+    points = np.asarray(ring, dtype=float)
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1 : end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            # 2-D cross product, np.cross is deprecated for 2-D vectors
+            crossProducts = segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]
+            distances = np.abs(crossProducts) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > geoJsonTolerance:
+            middle = start + 1 + farthest
+            keep[middle] = True
+            stack.append((start, middle))
+            stack.append((middle, end))
+
+    simplified = np.round(points[keep], geoJsonDecimals)
+    # Drop consecutive points that became identical after rounding
+    distinct = np.concatenate(([True], np.any(np.diff(simplified, axis=0), axis=1)))
+    simplified = simplified[distinct]
+    if len(simplified) < 4:
+        # Too small to survive simplification, keep the rounded original ring
+        simplified = np.round(points, geoJsonDecimals)
+    return simplified.tolist()
+
+
+def cleanGeoJson(countryCodes: set[str]) -> dict[str, Any]:
+    # Keep only the countries present in the dataset, with lighter polygons
+    with open("data/cleaned/countries.geo.json", "r") as f:
+        countries = json.load(f)
+
+    features = []
+    for feature in countries["features"]:
+        if feature["id"] not in countryCodes:
+            continue
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            coordinates = [simplifyRing(ring) for ring in geometry["coordinates"]]
+        else:
+            coordinates = [
+                [simplifyRing(ring) for ring in polygon]
+                for polygon in geometry["coordinates"]
+            ]
+        features.append(
+            {
+                "type": "Feature",
+                "id": feature["id"],
+                "properties": feature["properties"],
+                "geometry": {"type": geometry["type"], "coordinates": coordinates},
+            }
+        )
+
+    cleanCountries = {"type": "FeatureCollection", "features": features}
+    # Written next to the asset then renamed, so that a browser or another
+    # worker never reads a partial file
+    with tempfile.NamedTemporaryFile(
+        "w", dir="assets", suffix=".tmp", delete=False
+    ) as f:
+        json.dump(cleanCountries, f, separators=(",", ":"))
+    # NamedTemporaryFile only gives access to its owner
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, "assets/countries.geo.json")
+    return cleanCountries
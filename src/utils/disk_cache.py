@@ -0,0 +1,124 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from typing import Any
+
+import config
+
+# Results shared by every process of the app (gunicorn workers, restarts...)
+# as one pickle file per result in config.DISK_CACHE_DIRECTORY. Files are
+# written atomically and the least recently used ones are removed once the
+# directory grows over config.DISK_CACHE_MAX_BYTES.
+# Each process counts the bytes it writes on top of the size found by its last
+# scan of the directory, and only scans it again once that count goes over the
+# limit. The files are then removed down to evictionRatio of the limit, so that
+# the next scan is many writes away. The writes of the other processes are only
+# seen at the next scan, the directory can go over the limit until then.
+
+fileExtension = ".pickle"
+# Identifies the dataset and code the results were computed from, part of every
+# key. The disk cache is not used until it is set (see figure_cache.memoize).
+version = ""
+evictionRatio = 0.9
+lock = threading.Lock()
+statistics = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "scans": 0}
+# Size of the directory at the last scan plus the files written since, None
+# before the first scan
+estimatedBytes: int | None = None
+
+
+def setVersion(*parts: str | None) -> None:
+    global version
+    version = hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def getKey(name: str, arguments: tuple) -> str:
+    return hashlib.sha256(repr((version, name, arguments)).encode()).hexdigest()
+
+
+def getPath(key: str) -> str:
+    return os.path.join(config.DISK_CACHE_DIRECTORY, key + fileExtension)
+
+
+def read(key: str) -> tuple[bool, Any]:
+    # (True, value) if the result is in the cache, (False, None) otherwise
+    path = getPath(key)
+    try:
+        with open(path, "rb") as f:
+            value = pickle.load(f)
+        # The modification time is used as the last access time for the eviction
+        os.utime(path)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        with lock:
+            statistics["misses"] += 1
+        return False, None
+    with lock:
+        statistics["hits"] += 1
+    return True, value
+
+
+def write(key: str, value: Any) -> None:
+    os.makedirs(config.DISK_CACHE_DIRECTORY, exist_ok=True)
+    # Written next to its final path then renamed, so another process never
+    # reads a partial file
+    with tempfile.NamedTemporaryFile(
+        dir=config.DISK_CACHE_DIRECTORY, suffix=".tmp", delete=False
+    ) as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = f.tell()
+    os.replace(f.name, getPath(key))
+    global estimatedBytes
+    with lock:
+        statistics["writes"] += 1
+        isOverLimit = (
+            estimatedBytes is None
+            or estimatedBytes + size > config.DISK_CACHE_MAX_BYTES
+        )
+        if not isOverLimit:
+            estimatedBytes += size
+    if isOverLimit:
+        evict(int(config.DISK_CACHE_MAX_BYTES * evictionRatio))
+
+
+def evict(maxBytes: int) -> None:
+    # Remove the least recently used files until the directory fits in maxBytes
+    global estimatedBytes
+    if not os.path.isdir(config.DISK_CACHE_DIRECTORY):
+        with lock:
+            estimatedBytes = 0
+        return
+    with lock:
+        statistics["scans"] += 1
+    entries = []
+    for entry in os.scandir(config.DISK_CACHE_DIRECTORY):
+        if entry.name.endswith(fileExtension):
+            try:
+                fileStatus = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((fileStatus.st_mtime, fileStatus.st_size, entry.path))
+    totalBytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if totalBytes <= maxBytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # Already removed by another process
+            pass
+        totalBytes -= size
+        with lock:
+            statistics["evictions"] += 1
+    with lock:
+        estimatedBytes = totalBytes
+
+
+def getStatistics() -> dict[str, int]:
+    with lock:
+        return dict(statistics)
+
+
+def clear() -> None:
+    evict(0)
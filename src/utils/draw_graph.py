@@ -1,7 +1,26 @@
-import plotly_express as px
+import base64
+import functools
+import numpy as np
 import plotly.graph_objects as go
 import pandas as pds
+from collections.abc import Callable
+from dash import Patch
 from typing import Any
+import config
+from src.utils import format_graph_data
+
+# plotly express takes about half a second to import, it is imported by the
+# functions that use it so that it is only loaded when a figure is first drawn
+
+# plotly.js codes of the numeric types that can be sent as base64 typed arrays
+typedArrayCodes = {
+    "int8": "i1",
+    "int16": "i2",
+    "int32": "i4",
+    "float32": "f4",
+}
+# Trace attributes holding numeric arrays that are sent as typed arrays
+typedArrayAttributes = ["x", "y", "z"]
 
 continent_colors = {
     "Africa": "#5bb73b",
@@ -13,21 +32,308 @@ continent_colors = {
 }
 
 
+def getOtherContinents(data: pds.DataFrame) -> list[str]:
+    # Continents of data missing from continent_colors, in order of appearance
+    return [
+        continent
+        for continent in pds.unique(data["Continent_Name"])
+        if continent not in continent_colors
+    ]
+
+
+def addMissingContinents(
+    data: pds.DataFrame, **values: Any
+) -> tuple[pds.DataFrame, list[str]]:
+    # The continent graphs always have one trace per continent of
+    # continent_colors, in that order, so that their traces can be patched by
+    # index: a row with only values is added for each missing continent (its
+    # trace is emptied once drawn) and the rows are sorted by continent
+    presentContinents = set(pds.unique(data["Continent_Name"]))
+    missingContinents = [
+        continent
+        for continent in continent_colors
+        if continent not in presentContinents
+    ]
+    if missingContinents:
+        data = pds.concat(
+            [
+                data,
+                # Same column types as data, so that the concatenation keeps them
+                pds.DataFrame({"Continent_Name": missingContinents, **values}).astype(
+                    {name: data[name].dtype for name in values}
+                ),
+            ],
+            ignore_index=True,
+        )
+    continentRanks = {
+        continent: rank for rank, continent in enumerate(continent_colors)
+    }
+    ranks = [
+        continentRanks.get(continent, len(continent_colors))
+        for continent in data["Continent_Name"]
+    ]
+    return data.iloc[np.argsort(ranks, kind="stable")], missingContinents
+
+
+def getBubbleSizeRef(bubbleGraphData: pds.DataFrame) -> float:
+    # Same marker scaling as plotly express with its default size_max of 20,
+    # which is 0 when there are no markers (see addMissingContinents)
+    sizes = bubbleGraphData["gov_exp_pct_gdp"]
+    return sizes.max() / (20**2) if len(sizes) > 0 else 0.0
+
+
+def getContinentPositions(
+    data: pds.DataFrame, continents: list[str]
+) -> list[np.ndarray]:
+    # Positions of the rows of each continent, empty for the missing ones
+    positions = data.groupby("Continent_Name", observed=True, sort=False).indices
+    return [
+        positions.get(continent, np.empty(0, dtype=int)) for continent in continents
+    ]
+
+
+# Indicators drawn by drawCountryCurveEvolution, one line each
+countryCurveColumns = [
+    "school_enrol_primary_pct",
+    "school_enrol_secondary_pct",
+    "school_enrol_tertiary_pct",
+    "lit_rate_adult_pct",
+]
+
+
+def getCountryCurveRange(countryEducationData: pds.DataFrame) -> list[float]:
+    # At least up to 105 %, as a Python float as the validation of plotly would give
+    maxY = countryEducationData[countryCurveColumns].max().max()
+    return [0, float(max(105, maxY + 5))]
+
+
+# region figure templates
+# A draw function decorated with drawFromTemplate draws the first figure of
+# each kind itself (mostly with plotly express) and keeps it as a template.
+# The next figures of the same kind copy the template with new data arrays and
+# are built without validation, they are identical to the ones the draw
+# function would return.
+
+# Figure of each kind, as returned by to_plotly_json, keyed by draw function
+# name and template key
+figureTemplates: dict[tuple, dict[str, Any]] = {}
+
+# Values replacing the ones of the template: one dict per trace and one for
+# the layout, nested dicts (like marker) are merged with the template ones
+TemplateValues = tuple[list[dict[str, Any]], dict[str, Any]]
+
+
+def mergeAttributes(
+    attributes: dict[str, Any], values: dict[str, Any]
+) -> dict[str, Any]:
+    # Copy of attributes with values, the template is never modified
+    mergedAttributes = dict(attributes)
+    for name, value in values.items():
+        if isinstance(value, dict):
+            value = mergeAttributes(attributes.get(name, {}), value)
+        mergedAttributes[name] = value
+    return mergedAttributes
+
+
+def drawFromTemplate(
+    getKey: Callable[..., tuple | None],
+    getValues: Callable[..., TemplateValues],
+) -> Callable[[Callable[..., go.Figure]], Callable[..., go.Figure]]:
+    # getKey returns what defines the kind of the figure drawn from the draw
+    # function arguments (everything but the data arrays), or None if the
+    # figure must be drawn by the draw function. getValues takes the template
+    # and the arguments and returns the values of the new figure.
+    def decorator(draw: Callable[..., go.Figure]) -> Callable[..., go.Figure]:
+        @functools.wraps(draw)
+        def drawFigure(*arguments, **keywordArguments) -> go.Figure:
+            key = None
+            if config.USE_FIGURE_TEMPLATES:
+                key = getKey(*arguments, **keywordArguments)
+            if key is None:
+                return draw(*arguments, **keywordArguments)
+
+            key = (draw.__name__, *key)
+            template = figureTemplates.get(key)
+            if template is None:
+                figure = draw(*arguments, **keywordArguments)
+                figureTemplates[key] = figure.to_plotly_json()
+                return figure
+            traceValues, layoutValues = getValues(
+                template, *arguments, **keywordArguments
+            )
+            return go.Figure(
+                {
+                    "data": [
+                        mergeAttributes(trace, values)
+                        for trace, values in zip(template["data"], traceValues)
+                    ],
+                    "layout": mergeAttributes(template["layout"], layoutValues),
+                },
+                _validate=False,
+            )
+
+        return drawFigure
+
+    return decorator
+
+
+def getContinentTraces(
+    template: dict[str, Any], data: pds.DataFrame
+) -> list[np.ndarray]:
+    # Positions of the rows of each trace of a template with one trace per continent
+    return getContinentPositions(data, [trace["name"] for trace in template["data"]])
+
+
+def getEducationWorldMapTemplateKey(
+    worldEducationMapData: pds.DataFrame,
+    countries: str | dict[str, Any],
+    shouldDisplayPrimary: bool,
+    maxPupilTeacher: int,
+    isAnimated: bool = False,
+) -> tuple | None:
+    if isAnimated or not isinstance(countries, str):
+        return None
+    return (countries, shouldDisplayPrimary)
+
+
+def getEducationWorldMapTemplateValues(
+    template: dict[str, Any],
+    worldEducationMapData: pds.DataFrame,
+    countries: str | dict[str, Any],
+    shouldDisplayPrimary: bool,
+    maxPupilTeacher: int,
+    isAnimated: bool = False,
+) -> TemplateValues:
+    columnName = format_graph_data.getPupilTeacherColumn(shouldDisplayPrimary)
+    traceValues = {
+        "locations": worldEducationMapData["country_code"].to_numpy(),
+        "z": worldEducationMapData[columnName].to_numpy(),
+        "hovertext": worldEducationMapData["country"].to_numpy(),
+        "customdata": worldEducationMapData[["country_code"]].to_numpy(),
+    }
+    return [traceValues], {"coloraxis": {"cmax": maxPupilTeacher}}
+
+
+def getBubbleGraphTemplateKey(
+    bubbleGraphData: pds.DataFrame, isAnimated: bool = False
+) -> tuple | None:
+    if isAnimated:
+        return None
+    # Traces follow continent_colors, then the other continents as they appear
+    return (getBubbleRenderMode(bubbleGraphData), *getOtherContinents(bubbleGraphData))
+
+
+def getBubbleGraphTemplateValues(
+    template: dict[str, Any], bubbleGraphData: pds.DataFrame, isAnimated: bool = False
+) -> TemplateValues:
+    sizeref = getBubbleSizeRef(bubbleGraphData)
+    x = bubbleGraphData["school_enrol_primary_pct"].to_numpy()
+    y = bubbleGraphData["pri_comp_rate_pct"].to_numpy()
+    names = bubbleGraphData["country"].to_numpy()
+    sizes = bubbleGraphData["gov_exp_pct_gdp"].to_numpy()
+    traceValues = [
+        {
+            "x": x[positions],
+            "y": y[positions],
+            "hovertext": names[positions],
+            "marker": {"size": sizes[positions], "sizeref": sizeref},
+        }
+        for positions in getContinentTraces(template, bubbleGraphData)
+    ]
+    return traceValues, {}
+
+
+def getContinentGDPGraphTemplateKey(
+    continentEducationData: pds.DataFrame,
+) -> tuple | None:
+    # Traces follow continent_colors, then the other continents as they appear
+    return tuple(getOtherContinents(continentEducationData))
+
+
+def getContinentGDPGraphTemplateValues(
+    template: dict[str, Any], continentEducationData: pds.DataFrame
+) -> TemplateValues:
+    continents = continentEducationData["Continent_Name"].to_numpy()
+    values = continentEducationData["gov_exp_pct_gdp"].to_numpy()
+    traceValues = [
+        {"x": continents[positions], "y": values[positions]}
+        for positions in getContinentTraces(template, continentEducationData)
+    ]
+    return traceValues, {}
+
+
+def getHeatMapTemplateKey(
+    correlationData: pds.DataFrame, shouldDisplayText: bool
+) -> tuple | None:
+    return (
+        tuple(correlationData.columns),
+        tuple(correlationData.index),
+        shouldDisplayText,
+    )
+
+
+def getHeatMapTemplateValues(
+    template: dict[str, Any], correlationData: pds.DataFrame, shouldDisplayText: bool
+) -> TemplateValues:
+    return [{"z": correlationData.to_numpy()}], {}
+
+
+def getCountryGraphTemplateKey(countryEducationData: pds.DataFrame) -> tuple | None:
+    # plotly express draws no trace at all for a country without data
+    return () if len(countryEducationData) > 0 else None
+
+
+def getCountryCurveEvolutionTemplateValues(
+    template: dict[str, Any], countryEducationData: pds.DataFrame
+) -> TemplateValues:
+    traceValues = [
+        {
+            "x": countryEducationData["year"].to_numpy(),
+            "y": countryEducationData[columnName].to_numpy(),
+        }
+        for columnName in countryCurveColumns
+    ]
+    return traceValues, {"yaxis": {"range": getCountryCurveRange(countryEducationData)}}
+
+
+def getCountryPIBLiteratePopulationTemplateValues(
+    template: dict[str, Any], countryGraphData: pds.DataFrame
+) -> TemplateValues:
+    traceValues = [
+        {
+            "x": countryGraphData["year"].to_numpy(),
+            "y": countryGraphData[columnName].to_numpy(),
+        }
+        for columnName in ["gov_exp_pct_gdp", "lit_rate_adult_pct"]
+    ]
+    return traceValues, {}
+
+
+# endregion
+
+
+@drawFromTemplate(
+    getEducationWorldMapTemplateKey, getEducationWorldMapTemplateValues
+)
 def drawEducationWorldMap(
     worldEducationMapData: pds.DataFrame,
-    countries: dict[str, Any],
+    countries: str | dict[str, Any],
     shouldDisplayPrimary: bool,
     maxPupilTeacher: int,
+    isAnimated: bool = False,
 ) -> go.Figure:
+    # With isAnimated, worldEducationMapData holds every year and each one
+    # becomes a frame of the animation
+    import plotly_express as px
+
+    columnName = format_graph_data.getPupilTeacherColumn(shouldDisplayPrimary)
     return px.choropleth_map(
         worldEducationMapData,
         geojson=countries,
         locations="country_code",
-        color=(
-            "pupil_teacher_primary"
-            if shouldDisplayPrimary
-            else "pupil_teacher_secondary"
-        ),
+        animation_frame="year" if isAnimated else None,
+        animation_group="country_code" if isAnimated else None,
+        color=columnName,
         color_continuous_scale="YlGnBu",
         range_color=(0, maxPupilTeacher),
         map_style="carto-positron",
@@ -37,19 +343,31 @@ def drawEducationWorldMap(
         hover_data="country_code",
         hover_name="country",
         labels={
-            (
-                "pupil_teacher_primary"
-                if shouldDisplayPrimary
-                else "pupil_teacher_secondary"
-            ): "Nombre d'élèves par professeurs",
+            columnName: "Nombre d'élèves par professeurs",
             "country_code": "Code du pays",
+            "year": "Année",
         },
     )
 
 
-def drawBubbleGraph(bubbleGraphData: pds.DataFrame) -> go.Figure:
+@drawFromTemplate(getBubbleGraphTemplateKey, getBubbleGraphTemplateValues)
+def drawBubbleGraph(
+    bubbleGraphData: pds.DataFrame, isAnimated: bool = False
+) -> go.Figure:
+    # With isAnimated, bubbleGraphData holds every year and each one becomes a
+    # frame of the animation, with the same axes for all of them
+    import plotly_express as px
+
     global continent_colors
-    return px.scatter(
+    # Only SVG markers move smoothly from one frame to the next
+    renderMode = "svg" if isAnimated else getBubbleRenderMode(bubbleGraphData)
+    missingContinents = []
+    if not isAnimated:
+        # A marker size must be a number
+        bubbleGraphData, missingContinents = addMissingContinents(
+            bubbleGraphData, gov_exp_pct_gdp=0
+        )
+    bubbleGraph = px.scatter(
         bubbleGraphData,
         x="school_enrol_primary_pct",
         y="pri_comp_rate_pct",
@@ -57,18 +375,50 @@ def drawBubbleGraph(bubbleGraphData: pds.DataFrame) -> go.Figure:
         hover_name="country",
         color=bubbleGraphData["Continent_Name"],
         color_discrete_map=continent_colors,
+        category_orders={"Continent_Name": list(continent_colors)},
+        animation_frame="year" if isAnimated else None,
+        animation_group="country" if isAnimated else None,
+        range_x=getAnimationRange(bubbleGraphData["school_enrol_primary_pct"])
+        if isAnimated
+        else None,
+        range_y=getAnimationRange(bubbleGraphData["pri_comp_rate_pct"])
+        if isAnimated
+        else None,
+        render_mode=renderMode,
         labels={
             "school_enrol_primary_pct": "Taux de scolarisation primaire en pourcentage",
             "pri_comp_rate_pct": "Taux de réussite du cycle primaire en pourcentage",
             "gov_exp_pct_gdp": "Pourcentage du PIB investi dans l'éducation",
             "Continent_Name": "Continent",
+            "year": "Année",
         },
     )
+    for continent in missingContinents:
+        bubbleGraph.update_traces(
+            x=[], y=[], hovertext=[], marker_size=[], selector={"name": continent}
+        )
+    return bubbleGraph
 
 
+def getAnimationRange(values: pds.Series) -> list[float]:
+    return [0, values.max() * 1.05]
+
+
+def getBubbleRenderMode(bubbleGraphData: pds.DataFrame) -> str:
+    return "webgl" if len(bubbleGraphData) > config.BUBBLE_WEBGL_THRESHOLD else "svg"
+
+
+@drawFromTemplate(
+    getContinentGDPGraphTemplateKey, getContinentGDPGraphTemplateValues
+)
 def drawContinentGDPGraph(continentEducationData: pds.DataFrame) -> go.Figure:
+    import plotly_express as px
+
     global continent_colors
-    return px.histogram(
+    continentEducationData, missingContinents = addMissingContinents(
+        continentEducationData
+    )
+    continentGDPGraph = px.histogram(
         continentEducationData,
         x="Continent_Name",
         y="gov_exp_pct_gdp",
@@ -79,15 +429,26 @@ def drawContinentGDPGraph(continentEducationData: pds.DataFrame) -> go.Figure:
             "Continent_Name": "Continent",
         },
     ).update_layout(yaxis_title="Pourcentage moyen du PIB investi dans l'éducation").update_traces(hovertemplate='Continent: %{x} <br>PIB investi dans l\'éducation: %{y}%')
+    for continent in missingContinents:
+        continentGDPGraph.update_traces(x=[], y=[], selector={"name": continent})
+    return continentGDPGraph
 
 
+@drawFromTemplate(getHeatMapTemplateKey, getHeatMapTemplateValues)
+def drawHeatMap(correlationData: pds.DataFrame, shouldDisplayText: bool) -> go.Figure:
+    import plotly_express as px
+
+    return px.imshow(
+        correlationData, text_auto=shouldDisplayText, labels={"color": "Corrélation"}
+    )
+
+
+@drawFromTemplate(
+    getCountryGraphTemplateKey, getCountryCurveEvolutionTemplateValues
+)
 def drawCountryCurveEvolution(countryEducationData: pds.DataFrame) -> go.Figure:
-    yAxisColumns = [
-        "school_enrol_primary_pct",
-        "school_enrol_secondary_pct",
-        "school_enrol_tertiary_pct",
-        "lit_rate_adult_pct",
-    ]
+    import plotly_express as px
+
     newnames = {
         "school_enrol_primary_pct": "Taux de scolarisation primaire en pourcentage",
         "school_enrol_secondary_pct": "Taux de scolarisation secondaire en pourcentage",
@@ -98,8 +459,8 @@ def drawCountryCurveEvolution(countryEducationData: pds.DataFrame) -> go.Figure:
     countryCurveEvolution = px.line(
         countryEducationData,
         x="year",
-        y=yAxisColumns,
-        range_y=[0, max(105, countryEducationData[yAxisColumns].max().max() + 5)],
+        y=countryCurveColumns,
+        range_y=getCountryCurveRange(countryEducationData),
         labels={"year": "Année", "value": "Pourcentage", "variable":"Légende"},
     )
     countryCurveEvolution.update_traces(connectgaps=True)
@@ -107,6 +468,9 @@ def drawCountryCurveEvolution(countryEducationData: pds.DataFrame) -> go.Figure:
     return countryCurveEvolution
 
 
+@drawFromTemplate(
+    getCountryGraphTemplateKey, getCountryPIBLiteratePopulationTemplateValues
+)
 def drawCountryPIBLiteratePopulation(countryGraphData: pds.DataFrame) -> go.Figure:
     countryPIBLiteratePopulation = go.Figure()
 
@@ -140,3 +504,134 @@ def drawCountryPIBLiteratePopulation(countryGraphData: pds.DataFrame) -> go.Figu
     )
 
     return countryPIBLiteratePopulation
+
+
+# region compact figure encoding
+
+
+def encodeTypedArray(values: Any) -> Any:
+    # Numeric arrays are sent as base64 typed arrays (float32 or the smallest
+    # integer type) instead of JSON lists, other values and empty arrays are
+    # returned unchanged
+    array = np.asarray(values)
+    if array.size == 0:
+        return values
+    if array.dtype.kind == "f":
+        array = array.astype(np.float32)
+    elif array.dtype.kind in "iu":
+        for integerType in (np.int8, np.int16, np.int32):
+            bounds = np.iinfo(integerType)
+            if bounds.min <= array.min() and array.max() <= bounds.max:
+                array = array.astype(integerType)
+                break
+    if array.dtype.name not in typedArrayCodes or array.ndim > 2:
+        return values
+
+    # plotly.js reads typed arrays as little-endian
+    littleEndianArray = array.astype(array.dtype.newbyteorder("<"))
+    typedArray = {
+        "dtype": typedArrayCodes[array.dtype.name],
+        "bdata": base64.b64encode(littleEndianArray.tobytes()).decode("ascii"),
+    }
+    if array.ndim == 2:
+        typedArray["shape"] = f"{array.shape[0]}, {array.shape[1]}"
+    return typedArray
+
+
+def encodeFigure(figure: go.Figure) -> dict[str, Any]:
+    encodedFigure = figure.to_plotly_json()
+    for trace in encodedFigure["data"]:
+        for attribute in typedArrayAttributes:
+            if attribute in trace:
+                trace[attribute] = encodeTypedArray(trace[attribute])
+        if "size" in trace.get("marker", {}):
+            trace["marker"]["size"] = encodeTypedArray(trace["marker"]["size"])
+    return encodedFigure
+
+
+# endregion
+
+
+# region partial figure updates
+# These functions only send the values that change between two calls to the
+# matching draw function, the layout and the rest of the figure stay in the browser.
+# The continent graphs have one trace per continent, in continent_colors order
+# (see addMissingContinents), they are redrawn when the data has other continents.
+
+
+def patchEducationWorldMap(
+    worldEducationMapData: pds.DataFrame,
+    shouldDisplayPrimary: bool,
+    maxPupilTeacher: int,
+) -> Patch:
+    columnName = format_graph_data.getPupilTeacherColumn(shouldDisplayPrimary)
+    educationWorldMap = Patch()
+    educationWorldMap["data"][0]["locations"] = worldEducationMapData["country_code"]
+    educationWorldMap["data"][0]["z"] = encodeTypedArray(
+        worldEducationMapData[columnName]
+    )
+    educationWorldMap["data"][0]["hovertext"] = worldEducationMapData["country"]
+    educationWorldMap["data"][0]["customdata"] = worldEducationMapData[
+        ["country_code"]
+    ].to_numpy()
+    educationWorldMap["layout"]["coloraxis"]["cmax"] = maxPupilTeacher
+    return educationWorldMap
+
+
+def patchBubbleGraph(bubbleGraphData: pds.DataFrame) -> Patch | go.Figure:
+    global continent_colors
+    if getOtherContinents(bubbleGraphData):
+        return drawBubbleGraph(bubbleGraphData)
+
+    bubbleGraph = Patch()
+    sizeref = getBubbleSizeRef(bubbleGraphData)
+    # The trace type changes when the number of points crosses the WebGL threshold
+    traceType = (
+        "scattergl" if getBubbleRenderMode(bubbleGraphData) == "webgl" else "scatter"
+    )
+    x = bubbleGraphData["school_enrol_primary_pct"].to_numpy()
+    y = bubbleGraphData["pri_comp_rate_pct"].to_numpy()
+    names = bubbleGraphData["country"].to_numpy()
+    sizes = bubbleGraphData["gov_exp_pct_gdp"].to_numpy()
+    for traceIndex, positions in enumerate(
+        getContinentPositions(bubbleGraphData, list(continent_colors))
+    ):
+        trace = bubbleGraph["data"][traceIndex]
+        trace["type"] = traceType
+        trace["x"] = encodeTypedArray(x[positions])
+        trace["y"] = encodeTypedArray(y[positions])
+        trace["hovertext"] = names[positions]
+        trace["marker"]["size"] = encodeTypedArray(sizes[positions])
+        trace["marker"]["sizeref"] = sizeref
+    return bubbleGraph
+
+
+def patchContinentGDPGraph(continentEducationData: pds.DataFrame) -> Patch | go.Figure:
+    global continent_colors
+    if getOtherContinents(continentEducationData):
+        return drawContinentGDPGraph(continentEducationData)
+
+    continentGDPGraph = Patch()
+    continents = continentEducationData["Continent_Name"].to_numpy()
+    values = continentEducationData["gov_exp_pct_gdp"].to_numpy()
+    for traceIndex, positions in enumerate(
+        getContinentPositions(continentEducationData, list(continent_colors))
+    ):
+        continentGDPGraph["data"][traceIndex]["x"] = continents[positions]
+        continentGDPGraph["data"][traceIndex]["y"] = values[positions]
+    return continentGDPGraph
+
+
+def patchHeatMapData(correlationData: pds.DataFrame) -> Patch:
+    heatmap = Patch()
+    heatmap["data"][0]["z"] = encodeTypedArray(correlationData.to_numpy())
+    return heatmap
+
+
+def patchHeatMapText(shouldDisplayText: bool) -> Patch:
+    heatmap = Patch()
+    heatmap["data"][0]["texttemplate"] = "%{z}" if shouldDisplayText else ""
+    return heatmap
+
+
+# endregion
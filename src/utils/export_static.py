@@ -0,0 +1,158 @@
+# Static export of the dashboard: every figure of every state (year, map mode,
+# country) is rendered once to a JSON file, next to an HTML page that switches
+# between them in the browser. The output can be served by any web server.
+#
+# Usage (from the project root):
+#   python -m src.utils.export_static [outputDirectory] [--workers N]
+import argparse
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.offline
+
+from src.utils import draw_graph, format_graph_data, pipeline, store_data
+
+datasetPath = "data/cleaned/world-education-data"
+templatePath = os.path.join(os.path.dirname(__file__), "static_dashboard.html")
+sliderYears = range(1999, 2024)
+defaultYear = 2020
+defaultCountryCode = "FRA"
+# Relative to the exported index.html
+countries = "assets/countries.geo.json"
+
+# Dataset and derived structures of each worker process, see loadWorkerData
+workerData: dict = {}
+
+
+def loadWorkerData() -> None:
+    worldEducation = store_data.readDataset(datasetPath)
+    countryTable = store_data.readCountries(datasetPath)
+    workerData["worldEducation"] = worldEducation
+    workerData["countries"] = countryTable
+    workerData["cube"] = format_graph_data.buildAsOfCube(worldEducation, countryTable)
+    workerData["rollups"] = format_graph_data.buildRollups(workerData["cube"])
+    workerData["countryIndex"] = format_graph_data.buildCountryIndex(
+        worldEducation, countryTable
+    )
+
+
+def writeFigure(outputDirectory: str, name: str, figure) -> None:
+    with open(os.path.join(outputDirectory, "figures", f"{name}.json"), "w") as f:
+        f.write(figure.to_json())
+
+
+def exportYear(outputDirectory: str, year: int) -> None:
+    cube = workerData["cube"]
+    for displayPrimary, mode in ((True, "primary"), (False, "secondary")):
+        mapData, maxPupilTeacher = format_graph_data.getMapDataFromCube(
+            cube, year, displayPrimary
+        )
+        writeFigure(
+            outputDirectory,
+            f"map-{mode}-{year}",
+            draw_graph.drawEducationWorldMap(
+                mapData, countries, displayPrimary, maxPupilTeacher
+            ),
+        )
+    writeFigure(
+        outputDirectory,
+        f"bubble-{year}",
+        draw_graph.drawBubbleGraph(
+            format_graph_data.getBubbleData(workerData["worldEducation"], year)
+        ),
+    )
+    writeFigure(
+        outputDirectory,
+        f"continent-{year}",
+        draw_graph.drawContinentGDPGraph(
+            format_graph_data.getContinentEducationDataFromRollups(
+                workerData["rollups"], year
+            )
+        ),
+    )
+
+
+def exportCountry(outputDirectory: str, countryCode: str) -> None:
+    countryIndex = workerData["countryIndex"]
+    countryData = format_graph_data.getCountryData(
+        countryIndex, format_graph_data.getCountryKey(countryIndex, countryCode)
+    )
+    writeFigure(
+        outputDirectory,
+        f"country-curve-{countryCode}",
+        draw_graph.drawCountryCurveEvolution(countryData),
+    )
+    writeFigure(
+        outputDirectory,
+        f"country-bars-{countryCode}",
+        draw_graph.drawCountryPIBLiteratePopulation(countryData),
+    )
+
+
+def runExportTask(task: tuple[str, str, int | str]) -> None:
+    kind, outputDirectory, key = task
+    if kind == "year":
+        exportYear(outputDirectory, key)
+    else:
+        exportCountry(outputDirectory, key)
+
+
+def exportDashboard(outputDirectory: str, workers: int | None = None) -> None:
+    os.makedirs(os.path.join(outputDirectory, "figures"), exist_ok=True)
+    os.makedirs(os.path.join(outputDirectory, "assets"), exist_ok=True)
+    for assetName in ("countries.geo.json", "style.css"):
+        shutil.copy(
+            os.path.join("assets", assetName),
+            os.path.join(outputDirectory, "assets", assetName),
+        )
+    with open(os.path.join(outputDirectory, "plotly.min.js"), "w") as f:
+        f.write(plotly.offline.get_plotlyjs())
+
+    loadWorkerData()
+    worldEducation = workerData["worldEducation"]
+    writeFigure(
+        outputDirectory,
+        "heatmap",
+        draw_graph.drawHeatMap(
+            format_graph_data.buildCorrelationEngine(
+                worldEducation, pipeline.hashFile(datasetPath)
+            )(),
+            False,
+        ),
+    )
+    # Already sorted by name
+    countryNames = workerData["countries"]
+    with open(os.path.join(outputDirectory, "figures", "index.json"), "w") as f:
+        json.dump(
+            {
+                "years": list(sliderYears),
+                "defaultYear": defaultYear,
+                "defaultCountry": defaultCountryCode,
+                "countries": dict(
+                    zip(countryNames["country_code"], countryNames["country"])
+                ),
+            },
+            f,
+            ensure_ascii=False,
+        )
+    shutil.copy(templatePath, os.path.join(outputDirectory, "index.html"))
+
+    tasks = [("year", outputDirectory, year) for year in sliderYears] + [
+        ("country", outputDirectory, countryCode)
+        for countryCode in countryNames["country_code"]
+    ]
+    with ProcessPoolExecutor(max_workers=workers, initializer=loadWorkerData) as executor:
+        for _ in executor.map(runExportTask, tasks, chunksize=8):
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render every figure of the dashboard to a static bundle"
+    )
+    parser.add_argument("outputDirectory", nargs="?", default="build/static")
+    parser.add_argument("--workers", type=int, default=None)
+    arguments = parser.parse_args()
+    exportDashboard(arguments.outputDirectory, arguments.workers)
@@ -0,0 +1,183 @@
+import functools
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import config
+from src.utils import disk_cache
+
+registeredCaches: dict[str, Any] = {}
+
+speculationCondition = threading.Condition()
+# Name of a graph -> (cached function, arguments) still to compute for it
+pendingSpeculations: dict[str, deque[tuple[Callable, tuple]]] = {}
+speculationStatistics = {"scheduled": 0, "computed": 0, "cancelled": 0, "failed": 0}
+speculationThread: threading.Thread | None = None
+
+
+class LRUCache:
+    # Same as functools.lru_cache, but its entries can also be evicted by
+    # their arguments (see evict)
+
+    def __init__(self, function: Callable, maxsize: int) -> None:
+        functools.update_wrapper(self, function)
+        self.function = function
+        self.maxsize = maxsize
+        self.entries: OrderedDict[tuple, Any] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, *arguments: Any) -> Any:
+        with self.lock:
+            if arguments in self.entries:
+                self.entries.move_to_end(arguments)
+                self.hits += 1
+                return self.entries[arguments]
+            self.misses += 1
+        # Computed without the lock, two threads missing the same entry both compute it
+        result = self.function(*arguments)
+        with self.lock:
+            self.entries[arguments] = result
+            self.entries.move_to_end(arguments)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return result
+
+    def evict(self, shouldEvict: Callable[[tuple], bool]) -> None:
+        with self.lock:
+            for arguments in [
+                arguments for arguments in self.entries if shouldEvict(arguments)
+            ]:
+                del self.entries[arguments]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def memoize(name: str, maxsize: int = config.FIGURE_CACHE_SIZE) -> Callable:
+    # LRU cache for functions whose arguments are the dashboard inputs
+    # (year, map mode, country...), registered under name for the statistics.
+    # Its misses are looked up in the disk cache shared by all the processes,
+    # once they set its version (main.py does, scripts such as the export do not).
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def sharedFunction(*arguments: Any) -> Any:
+            if not config.USE_DISK_CACHE or not disk_cache.version:
+                return function(*arguments)
+            key = disk_cache.getKey(name, arguments)
+            isCached, result = disk_cache.read(key)
+            if not isCached:
+                result = function(*arguments)
+                disk_cache.write(key, result)
+            return result
+
+        cachedFunction = LRUCache(sharedFunction, maxsize)
+        registeredCaches[name] = cachedFunction
+        return cachedFunction
+
+    return decorator
+
+
+def getCacheStatistics() -> dict[str, dict[str, int]]:
+    statistics = {}
+    for name, cachedFunction in registeredCaches.items():
+        with cachedFunction.lock:
+            statistics[name] = {
+                "hits": cachedFunction.hits,
+                "misses": cachedFunction.misses,
+                "size": len(cachedFunction.entries),
+                "maxsize": cachedFunction.maxsize,
+            }
+    statistics["disk"] = disk_cache.getStatistics()
+    with speculationCondition:
+        statistics["speculation"] = {
+            **speculationStatistics,
+            "pending": sum(len(tasks) for tasks in pendingSpeculations.values()),
+        }
+    return statistics
+
+
+def clearCaches() -> None:
+    for cachedFunction in registeredCaches.values():
+        cachedFunction.clear()
+
+
+def evict(shouldEvict: Callable[[tuple], bool]) -> None:
+    # Remove from every cache the entries whose arguments match, e.g. those of
+    # a dataset that was replaced
+    for cachedFunction in registeredCaches.values():
+        cachedFunction.evict(shouldEvict)
+
+
+def prewarm(
+    cachedFunction: Callable, argumentsList: Iterable[tuple], background: bool = True
+) -> threading.Thread | None:
+    # Fill the cache ahead of the first requests, by default without blocking startup
+    def fill() -> None:
+        for arguments in argumentsList:
+            cachedFunction(*arguments)
+
+    if not background:
+        fill()
+        return None
+    thread = threading.Thread(target=fill, name="figure-cache-prewarm", daemon=True)
+    thread.start()
+    return thread
+
+
+def speculate(
+    name: str, cachedFunction: Callable, argumentsList: Iterable[tuple]
+) -> None:
+    # Compute in the background the results likely to be asked next (e.g. the
+    # neighbouring years of the slider). What is still pending for name is
+    # dropped, so jumping elsewhere cancels the work planned for the old position.
+    global speculationThread
+    with speculationCondition:
+        cancelledTasks = pendingSpeculations.pop(name, ())
+        speculationStatistics["cancelled"] += len(cancelledTasks)
+        tasks = deque((cachedFunction, arguments) for arguments in argumentsList)
+        speculationStatistics["scheduled"] += len(tasks)
+        if tasks:
+            pendingSpeculations[name] = tasks
+        if speculationThread is None:
+            speculationThread = threading.Thread(
+                target=runSpeculations, name="figure-cache-speculation", daemon=True
+            )
+            speculationThread.start()
+        speculationCondition.notify()
+
+
+def runSpeculations() -> None:
+    # One task at a time and after a pause, to leave the CPU to the callbacks
+    # answering actual requests
+    while True:
+        with speculationCondition:
+            while not pendingSpeculations:
+                speculationCondition.wait()
+        time.sleep(config.SPECULATION_DELAY_SECONDS)
+        with speculationCondition:
+            if not pendingSpeculations:
+                continue
+            name = next(iter(pendingSpeculations))
+            # Graphs take turns, the one just served goes to the back
+            tasks = pendingSpeculations.pop(name)
+            cachedFunction, arguments = tasks.popleft()
+            if tasks:
+                pendingSpeculations[name] = tasks
+        try:
+            cachedFunction(*arguments)
+        except Exception:
+            # The same call made by a callback will raise the error to the user
+            outcome = "failed"
+        else:
+            outcome = "computed"
+        # The arguments (e.g. a replaced dataset) are not kept while waiting
+        del cachedFunction, arguments
+        with speculationCondition:
+            speculationStatistics[outcome] += 1
@@ -1,13 +1,67 @@
 import pandas as pds
 import numpy as np
+from typing import NamedTuple
+import config
+from src.utils import figure_cache
+
+indicatorColumns = [
+    "gov_exp_pct_gdp",
+    "lit_rate_adult_pct",
+    "pri_comp_rate_pct",
+    "pupil_teacher_primary",
+    "pupil_teacher_secondary",
+    "school_enrol_primary_pct",
+    "school_enrol_secondary_pct",
+    "school_enrol_tertiary_pct",
+]
+
+
+def getPupilTeacherColumn(displayPrimary: bool) -> str:
+    # Indicator shown on the map, primary or secondary pupils per teacher
+    return "pupil_teacher_primary" if displayPrimary else "pupil_teacher_secondary"
+
+
+class AsOfCube(NamedTuple):
+    # Country dimension table, sorted by name and indexed by country key,
+    # aligned with the first axis of values
+    countries: pds.DataFrame
+    years: np.ndarray
+    columns: list[str]
+    # Shape (country, year, indicator), forward-filled along the year axis
+    values: np.ndarray
+
+
+def buildAsOfCube(baseData: pds.DataFrame, countries: pds.DataFrame) -> AsOfCube:
+    years = np.arange(baseData["year"].min(), baseData["year"].max() + 1)
+    countryIndex = baseData["country_id"].to_numpy()
+    yearIndex = baseData["year"].to_numpy() - years[0]
+
+    values = np.full(
+        (len(countries), len(years), len(indicatorColumns)), np.nan, dtype=float
+    )
+    values[countryIndex, yearIndex] = baseData[indicatorColumns].to_numpy(dtype=float)
+
+    # Carry the last known value of each indicator forward through the years
+    lastKnown = np.where(
+        np.isnan(values), 0, np.arange(len(years))[np.newaxis, :, np.newaxis]
+    )
+    np.maximum.accumulate(lastKnown, axis=1, out=lastKnown)
+    values = np.take_along_axis(values, lastKnown, axis=1)
+    return AsOfCube(countries, years, list(indicatorColumns), values)
+
+
+def getAsOfValues(cube: AsOfCube, year: int, columnName: str) -> np.ndarray:
+    # Latest known value of the indicator for each country at or before year
+    if year < cube.years[0]:
+        return np.full(len(cube.countries), np.nan)
+    yearIndex = min(year, cube.years[-1]) - cube.years[0]
+    return cube.values[:, yearIndex, cube.columns.index(columnName)]
 
 
 def getMapData(
     baseData: pds.DataFrame, year: int, displayPrimary: bool
 ) -> tuple[pds.DataFrame, int]:
-    columnName = (
-        "pupil_teacher_primary" if displayPrimary else "pupil_teacher_secondary"
-    )
+    columnName = getPupilTeacherColumn(displayPrimary)
     worldEducationForMap = baseData[
         (baseData[columnName].notna()) & (baseData["year"] <= year)
     ]
@@ -32,32 +86,432 @@ def getContinentEducationData(baseData: pds.DataFrame, year: int) -> pds.DataFra
         subset="country", keep="first"
     )
     return (
-        continentEducationData.groupby("Continent_Name")["gov_exp_pct_gdp"]
+        continentEducationData.groupby("Continent_Name", observed=True)["gov_exp_pct_gdp"]
         .mean()
         .reset_index()
     )
 
 
+class CountryIndex(NamedTuple):
+    # The dataset itself, its memory-mapped columns are not copied
+    data: pds.DataFrame
+    # Row positions sorted by country key then year, None when the dataset is
+    # already in that order (as the clean stage writes it)
+    order: np.ndarray | None
+    # Range [starts[key], ends[key]) of the sorted rows of each country key
+    starts: np.ndarray
+    ends: np.ndarray
+    # Key of each country name and ISO3 code
+    countryKeys: dict[str, int]
+
+
+def buildCountryIndex(baseData: pds.DataFrame, countries: pds.DataFrame) -> CountryIndex:
+    keys = baseData["country_id"].to_numpy()
+    years = baseData["year"].to_numpy()
+    isSorted = bool(
+        np.all(
+            (keys[1:] > keys[:-1])
+            | ((keys[1:] == keys[:-1]) & (years[1:] >= years[:-1]))
+        )
+    )
+    # Otherwise only the sorted positions are kept, not a sorted copy of the rows
+    order = None if isSorted else np.lexsort((years, keys)).astype(np.int32)
+    sortedKeys = keys if order is None else keys[order]
+    countryKeyRange = np.arange(len(countries))
+    starts = np.searchsorted(sortedKeys, countryKeyRange, side="left")
+    ends = np.searchsorted(sortedKeys, countryKeyRange, side="right")
+
+    countryKeys = {
+        **dict(zip(countries["country"], countryKeyRange.tolist())),
+        **dict(zip(countries["country_code"], countryKeyRange.tolist())),
+    }
+    return CountryIndex(baseData, order, starts, ends, countryKeys)
+
+
+def getCountryKey(index: CountryIndex, country: str) -> int | None:
+    # Key of a country given its name or ISO3 code, None if it is unknown
+    return index.countryKeys.get(country)
+
+
+def getCountryData(index: CountryIndex, countryKey: int | None) -> pds.DataFrame:
+    # Rows of a country given its key, empty if it is unknown
+    if countryKey is None:
+        return index.data.iloc[0:0]
+    rows = slice(index.starts[countryKey], index.ends[countryKey])
+    if index.order is None:
+        return index.data.iloc[rows]
+    return index.data.iloc[index.order[rows]]
+
+
+def getMapDataFromCube(
+    cube: AsOfCube, year: int, displayPrimary: bool
+) -> tuple[pds.DataFrame, int]:
+    columnName = getPupilTeacherColumn(displayPrimary)
+    values = getAsOfValues(cube, year, columnName)
+    # Same rows as getMapData, except the countries without polygons on the map
+    # (feature_index -1, small islands and city states such as Singapore) which
+    # could not be drawn: they are not sent and not part of maxPupilTeacher
+    hasValue = ~np.isnan(values) & (cube.countries["feature_index"].to_numpy() >= 0)
+    worldEducationForMap = cube.countries[hasValue].assign(
+        **{columnName: values[hasValue]}
+    )
+    maxPupilTeacher = worldEducationForMap[columnName].max()
+    return worldEducationForMap, maxPupilTeacher
+
+
+def getContinentEducationDataFromCube(cube: AsOfCube, year: int) -> pds.DataFrame:
+    values = getAsOfValues(cube, year, "gov_exp_pct_gdp")
+    hasValue = ~np.isnan(values)
+    continentCodes, continentNames = pds.factorize(
+        cube.countries["Continent_Name"][hasValue], sort=True
+    )
+    totals = np.bincount(continentCodes, weights=values[hasValue])
+    counts = np.bincount(continentCodes)
+    return pds.DataFrame(
+        {
+            "Continent_Name": continentNames,
+            "gov_exp_pct_gdp": totals / counts,
+        }
+    )
+
+
+def getMapAnimationData(
+    cube: AsOfCube, displayPrimary: bool
+) -> tuple[pds.DataFrame, int]:
+    # Map data of every year of the cube at once, sorted by year: the rows of
+    # a year are the ones getMapDataFromCube returns for it
+    columnName = getPupilTeacherColumn(displayPrimary)
+    values = cube.values[:, :, cube.columns.index(columnName)]
+    hasValue = ~np.isnan(values) & (
+        cube.countries["feature_index"].to_numpy() >= 0
+    )[:, np.newaxis]
+    yearIndex, countryIndex = np.nonzero(hasValue.T)
+    mapAnimationData = (
+        cube.countries.iloc[countryIndex]
+        .reset_index(drop=True)
+        .assign(
+            year=cube.years[yearIndex],
+            **{columnName: values[countryIndex, yearIndex]},
+        )
+    )
+    maxPupilTeacher = mapAnimationData[columnName].max()
+    return mapAnimationData, maxPupilTeacher
+
+
+def getBubbleAnimationData(baseData: pds.DataFrame, years: range) -> pds.DataFrame:
+    # Bubble data of every year at once, sorted by year: the rows of a year
+    # are the ones getBubbleData returns for it (without the binning)
+    bubbleAnimationData = baseData[
+        (baseData["year"] >= years[0]) & (baseData["year"] <= years[-1])
+    ].sort_values(by="year", kind="stable")
+    return bubbleAnimationData.assign(
+        gov_exp_pct_gdp=bubbleAnimationData["gov_exp_pct_gdp"].fillna(0).astype(float)
+    )
+
+
+rollupStatistics = ["mean", "median", "count", "min", "max"]
+worldName = "World"
+
+
+class Rollups(NamedTuple):
+    # Continents in alphabetical order followed by worldName, aligned with the
+    # first axis of values
+    groups: list[str]
+    years: np.ndarray
+    columns: list[str]
+    # Shape (group, year, indicator, statistic) with the statistics in
+    # rollupStatistics order, computed on the latest known value of each
+    # country (as in the as-of cube), NaN where no country has a value
+    values: np.ndarray
+
+
+def getGroupStatistics(values: np.ndarray) -> np.ndarray:
+    # Statistics of values (country, year, indicator) over its countries,
+    # ignoring NaN, with shape (year, indicator, statistic)
+    known = ~np.isnan(values)
+    counts = known.sum(axis=0)
+    totals = np.where(known, values, 0.0).sum(axis=0)
+    # NaN are sorted last, so the known values of each cell come first
+    sortedValues = np.sort(values, axis=0)
+    lowMiddle = np.take_along_axis(
+        sortedValues, np.maximum((counts - 1) // 2, 0)[np.newaxis], axis=0
+    )[0]
+    highMiddle = np.take_along_axis(
+        sortedValues, np.minimum(counts // 2, max(len(values) - 1, 0))[np.newaxis], axis=0
+    )[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        statistics = np.stack(
+            [
+                totals / counts,
+                (lowMiddle + highMiddle) / 2,
+                counts,
+                np.where(known, values, np.inf).min(axis=0, initial=np.inf),
+                np.where(known, values, -np.inf).max(axis=0, initial=-np.inf),
+            ],
+            axis=-1,
+        )
+    isEmpty = counts == 0
+    statistics[isEmpty, :] = np.nan
+    statistics[isEmpty, rollupStatistics.index("count")] = 0
+    return statistics
+
+
+def buildRollups(
+    cube: AsOfCube,
+    previousCube: AsOfCube | None = None,
+    previousRollups: Rollups | None = None,
+) -> Rollups:
+    # Statistics of every indicator per continent and for the world, for every
+    # year of the cube. Given the cube and rollups of a previous version of the
+    # dataset with the same countries and years, only the years whose values
+    # changed are computed again.
+    continentNames = sorted(cube.countries["Continent_Name"].unique())
+    groups = [*continentNames, worldName]
+    continentOfCountry = cube.countries["Continent_Name"].to_numpy(dtype=object)
+    groupMasks = [continentOfCountry == name for name in continentNames] + [
+        np.ones(len(cube.countries), dtype=bool)
+    ]
+
+    yearsToCompute = np.arange(len(cube.years))
+    values = np.full(
+        (len(groups), len(cube.years), len(cube.columns), len(rollupStatistics)),
+        np.nan,
+    )
+    if (
+        previousCube is not None
+        and previousRollups is not None
+        and previousRollups.groups == groups
+        and previousCube.columns == cube.columns
+        and np.array_equal(previousCube.years, cube.years)
+        and previousCube.countries.equals(cube.countries)
+    ):
+        isYearChanged = ~(
+            (previousCube.values == cube.values)
+            | (np.isnan(previousCube.values) & np.isnan(cube.values))
+        ).all(axis=(0, 2))
+        yearsToCompute = np.flatnonzero(isYearChanged)
+        values[:] = previousRollups.values
+
+    for groupIndex, groupMask in enumerate(groupMasks):
+        values[groupIndex, yearsToCompute] = getGroupStatistics(
+            cube.values[groupMask][:, yearsToCompute]
+        )
+    return Rollups(groups, cube.years, list(cube.columns), values)
+
+
+def getRollupValues(
+    rollups: Rollups, year: int, columnName: str, statistic: str
+) -> np.ndarray:
+    # Statistic of the indicator for each group at year, as getAsOfValues
+    if year < rollups.years[0]:
+        return np.full(len(rollups.groups), 0.0 if statistic == "count" else np.nan)
+    yearIndex = min(year, rollups.years[-1]) - rollups.years[0]
+    return rollups.values[
+        :,
+        yearIndex,
+        rollups.columns.index(columnName),
+        rollupStatistics.index(statistic),
+    ]
+
+
+def getContinentEducationDataFromRollups(
+    rollups: Rollups, year: int
+) -> pds.DataFrame:
+    # Same result as getContinentEducationDataFromCube, read from the rollups
+    means = getRollupValues(rollups, year, "gov_exp_pct_gdp", "mean")[:-1]
+    hasValue = ~np.isnan(means)
+    return pds.DataFrame(
+        {
+            "Continent_Name": np.asarray(rollups.groups[:-1], dtype=object)[hasValue],
+            "gov_exp_pct_gdp": means[hasValue],
+        }
+    )
+
+
 def getBubbleData(baseData: pds.DataFrame, year: int) -> pds.DataFrame:
     bubbleData = baseData[baseData["year"] == year]
     bubbleData.loc[:, "gov_exp_pct_gdp"] = (
         bubbleData["gov_exp_pct_gdp"].fillna(0).astype(float)
     )
+    if len(bubbleData) > config.BUBBLE_BINNING_THRESHOLD:
+        return getBinnedBubbleData(bubbleData, config.BUBBLE_BINS)
     return bubbleData
 
 
+def getBinnedBubbleData(bubbleData: pds.DataFrame, bins: int) -> pds.DataFrame:
+    # Aggregate the points on a bins x bins grid: each occupied cell becomes one
+    # bubble at its center, sized by the mean investment of its points and
+    # coloured by the continent most of its points belong to
+    bubbleData = bubbleData.dropna(
+        subset=["school_enrol_primary_pct", "pri_comp_rate_pct"]
+    )
+    x = bubbleData["school_enrol_primary_pct"].to_numpy(dtype=float)
+    y = bubbleData["pri_comp_rate_pct"].to_numpy(dtype=float)
+    xEdges = np.linspace(x.min(initial=0), x.max(initial=0), bins + 1)
+    yEdges = np.linspace(y.min(initial=0), y.max(initial=0), bins + 1)
+    xBins = np.clip(np.searchsorted(xEdges, x, side="right") - 1, 0, bins - 1)
+    yBins = np.clip(np.searchsorted(yEdges, y, side="right") - 1, 0, bins - 1)
+    cells = xBins * bins + yBins
+
+    continentCodes, continentNames = pds.factorize(
+        bubbleData["Continent_Name"], sort=True
+    )
+    counts = np.bincount(cells, minlength=bins * bins)
+    investments = np.bincount(
+        cells, weights=bubbleData["gov_exp_pct_gdp"], minlength=bins * bins
+    )
+    continentCounts = np.bincount(
+        cells * len(continentNames) + continentCodes,
+        minlength=bins * bins * len(continentNames),
+    ).reshape(bins * bins, len(continentNames))
+
+    occupied = np.flatnonzero(counts)
+    xCenters = (xEdges[:-1] + xEdges[1:]) / 2
+    yCenters = (yEdges[:-1] + yEdges[1:]) / 2
+    return pds.DataFrame(
+        {
+            "country": [f"{count} pays" for count in counts[occupied]],
+            "Continent_Name": np.asarray(continentNames)[
+                continentCounts[occupied].argmax(axis=1)
+            ],
+            "school_enrol_primary_pct": xCenters[occupied // bins],
+            "pri_comp_rate_pct": yCenters[occupied % bins],
+            "gov_exp_pct_gdp": investments[occupied] / counts[occupied],
+        }
+    )
+
+
+correlationLabels = {
+    "school_enrol_primary_pct": "Scolarisation en primaire",
+    "school_enrol_secondary_pct": "Scolarisation en secondaire",
+    "school_enrol_tertiary_pct": "Scolarisation en tertiaire",
+    "pupil_teacher_primary": "Encadrement en primaire",
+    "pupil_teacher_secondary": "Encadrement en secondaire",
+    "lit_rate_adult_pct": "Alphabétisation des adultes",
+    "pri_comp_rate_pct": "Réussite du cycle primaire",
+    "gov_exp_pct_gdp": "PIB investi dans l'éducation",
+}
+
+
 def getCorrelationData(baseData: pds.DataFrame) -> pds.DataFrame:
-    renamed_columns = {
-        "school_enrol_primary_pct": "Scolarisation en primaire",
-        "school_enrol_secondary_pct": "Scolarisation en secondaire",
-        "school_enrol_tertiary_pct": "Scolarisation en tertiaire",
-        "pupil_teacher_primary": "Encadrement en primaire",
-        "pupil_teacher_secondary": "Encadrement en secondaire",
-        "lit_rate_adult_pct": "Alphabétisation des adultes",
-        "pri_comp_rate_pct": "Réussite du cycle primaire",
-        "gov_exp_pct_gdp": "PIB investi dans l'éducation",
-    }
-    baseData = baseData.rename(columns=renamed_columns, index=renamed_columns)
+    baseData = baseData.rename(columns=correlationLabels, index=correlationLabels)
     dataTypes = baseData.drop(columns=["year"]).select_dtypes(include=[np.number])
     correlationData = dataTypes.corr().round(2)
     return correlationData
+
+
+# Rows of the indicators converted to float64 at once by getPairwiseCorrelation
+correlationBlockRows = 1 << 16
+
+
+def getCorrelationBlocks(columns: list[np.ndarray], rows: np.ndarray | None):
+    # Blocks of at most correlationBlockRows of the given rows (all if None),
+    # one float64 column per indicator
+    rowCount = len(columns[0]) if rows is None else len(rows)
+    for start in range(0, rowCount, correlationBlockRows):
+        blockRows = (
+            slice(start, start + correlationBlockRows)
+            if rows is None
+            else rows[start : start + correlationBlockRows]
+        )
+        block = np.empty(
+            (min(correlationBlockRows, rowCount - start), len(columns))
+        )
+        for columnIndex, column in enumerate(columns):
+            block[:, columnIndex] = column[blockRows]
+        yield block
+
+
+def getPairwiseCorrelation(
+    columns: list[np.ndarray], rows: np.ndarray | None = None
+) -> np.ndarray:
+    # Pearson correlation of every pair of columns using only the rows where
+    # both are known (same as DataFrame.corr), computed with matrix products.
+    # The columns (memory-mapped) are only read by blocks of rows, so that no
+    # float64 copy of all of them is made.
+    pairCounts = np.zeros((len(columns), len(columns)))
+    # sums[i, j]: sum of column i over the rows where column j is known
+    sums = np.zeros((len(columns), len(columns)))
+    squareSums = np.zeros((len(columns), len(columns)))
+    productSums = np.zeros((len(columns), len(columns)))
+    shifts = None
+    for block in getCorrelationBlocks(columns, rows):
+        known = ~np.isnan(block)
+        knownFloat = known.astype(float)
+        if shifts is None:
+            # The values are shifted by the means of the first block, which
+            # keeps the sums small and the result precise in a single pass
+            shifts = np.where(known, block, 0.0).sum(axis=0) / np.maximum(
+                knownFloat.sum(axis=0), 1
+            )
+        shifted = np.where(known, block - shifts, 0.0)
+        pairCounts += knownFloat.T @ knownFloat
+        sums += shifted.T @ knownFloat
+        squareSums += (shifted**2).T @ knownFloat
+        productSums += shifted.T @ shifted
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covariance = productSums - sums * sums.T / pairCounts
+        variance = squareSums - sums**2 / pairCounts
+        correlation = covariance / np.sqrt(variance * variance.T)
+    correlation[pairCounts < 2] = np.nan
+    return np.clip(correlation, -1, 1)
+
+
+class CorrelationEngine:
+    # Gives the correlation matrix of the indicators for an optional (first,
+    # last) year range and continent subset. Only views of the columns and the
+    # continent codes are kept, not a copy of the data. The matrices of every
+    # engine are cached by getFilteredCorrelationData, datasetVersion tells
+    # apart those of the different versions of the dataset in the disk cache.
+
+    def __init__(self, baseData: pds.DataFrame, datasetVersion: str | None) -> None:
+        self.datasetVersion = datasetVersion
+        self.columns = [
+            baseData[columnName].to_numpy() for columnName in indicatorColumns
+        ]
+        self.years = baseData["year"].to_numpy()
+        self.continentCodes = baseData["Continent_Name"].cat.codes.to_numpy()
+        self.continentCategories = baseData["Continent_Name"].cat.categories
+
+    def __repr__(self) -> str:
+        # Used in the keys of the disk cache
+        return f"CorrelationEngine({self.datasetVersion})"
+
+    def __call__(
+        self,
+        yearRange: tuple[int, int] | None = None,
+        continentNames: list[str] | None = None,
+    ) -> pds.DataFrame:
+        return getFilteredCorrelationData(
+            self,
+            None if yearRange is None else tuple(yearRange),
+            None if continentNames is None else tuple(sorted(continentNames)),
+        )
+
+
+@figure_cache.memoize("correlationData")
+def getFilteredCorrelationData(
+    engine: CorrelationEngine,
+    yearRange: tuple[int, int] | None,
+    continentNames: tuple[str, ...] | None,
+) -> pds.DataFrame:
+    rows = None
+    if yearRange is not None or continentNames is not None:
+        selected = np.ones(len(engine.years), dtype=bool)
+        if yearRange is not None:
+            selected &= (engine.years >= yearRange[0]) & (engine.years <= yearRange[1])
+        if continentNames is not None:
+            codes = engine.continentCategories.get_indexer(continentNames)
+            selected &= np.isin(engine.continentCodes, codes[codes >= 0])
+        rows = np.flatnonzero(selected)
+    labels = [correlationLabels[columnName] for columnName in indicatorColumns]
+    return pds.DataFrame(
+        getPairwiseCorrelation(engine.columns, rows), index=labels, columns=labels
+    ).round(2)
+
+
+def buildCorrelationEngine(
+    baseData: pds.DataFrame, datasetVersion: str | None = None
+) -> CorrelationEngine:
+    return CorrelationEngine(baseData, datasetVersion)
@@ -1,7 +1,8 @@
-import kaggle
-
-
 def downloadDataset() -> None:
+    # Imported here because the kaggle package authenticates as soon as it is
+    # imported, which is not needed when the raw files are already available
+    import kaggle
+
     # Download the raw dataset
     kaggle.api.authenticate()
     kaggle.api.dataset_download_files(
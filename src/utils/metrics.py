@@ -0,0 +1,159 @@
+import cProfile
+import functools
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+
+import flask
+
+import config
+
+# Upper bounds of the latency histogram buckets, in seconds
+latencyBuckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# Upper bounds of the response size histogram buckets, in bytes
+sizeBuckets = [1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000]
+
+lock = threading.Lock()
+# (callback, phase) -> [count of each bucket..., count above the last one, sum]
+latencies: dict[tuple[str, str], list[float]] = {}
+# callback -> [count of each bucket..., count above the last one, sum]
+responseSizes: dict[str, list[float]] = {}
+# Name of the callback running in the current thread, used to label the phases
+currentCallback = threading.local()
+# Time taken to import main.py, from its first import to a ready app
+startupSeconds: float | None = None
+
+
+def observe(histogram: list[float], buckets: list[float], value: float) -> None:
+    bucketIndex = next(
+        (index for index, bound in enumerate(buckets) if value <= bound),
+        len(buckets),
+    )
+    histogram[bucketIndex] += 1
+    histogram[-1] += value
+
+
+def recordStartup(seconds: float) -> None:
+    global startupSeconds
+    startupSeconds = seconds
+
+
+def recordLatency(callbackName: str, phase: str, seconds: float) -> None:
+    with lock:
+        histogram = latencies.setdefault(
+            (callbackName, phase), [0.0] * (len(latencyBuckets) + 2)
+        )
+        observe(histogram, latencyBuckets, seconds)
+
+
+def recordResponseSize(callbackName: str, size: int) -> None:
+    with lock:
+        histogram = responseSizes.setdefault(
+            callbackName, [0.0] * (len(sizeBuckets) + 2)
+        )
+        observe(histogram, sizeBuckets, size)
+
+
+@contextmanager
+def measurePhase(phase: str) -> Iterator[None]:
+    # Time a part of the running callback (data shaping, figure build...)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        callbackName = getattr(currentCallback, "name", None)
+        if callbackName is not None:
+            recordLatency(callbackName, phase, time.perf_counter() - start)
+
+
+def instrumentCallback(callback: Callable) -> Callable:
+    # Record the total duration of a Dash callback, and when enabled keep a
+    # cProfile dump of the calls slower than SLOW_CALLBACK_SECONDS
+    @functools.wraps(callback)
+    def instrumentedCallback(*args, **kwargs):
+        currentCallback.name = callback.__name__
+        profiler = cProfile.Profile() if config.PROFILE_SLOW_CALLBACKS else None
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                return callback(*args, **kwargs)
+            return profiler.runcall(callback, *args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            currentCallback.name = None
+            recordLatency(callback.__name__, "callback", duration)
+            if flask.has_request_context():
+                # Read back by recordEncoding once the response is serialized
+                flask.g.metricsCallback = (callback.__name__, time.perf_counter())
+            if profiler is not None and duration > config.SLOW_CALLBACK_SECONDS:
+                os.makedirs(config.PROFILE_DIRECTORY, exist_ok=True)
+                profiler.dump_stats(
+                    os.path.join(
+                        config.PROFILE_DIRECTORY,
+                        f"{callback.__name__}-{time.time_ns()}.prof",
+                    )
+                )
+
+    return instrumentedCallback
+
+
+def recordEncoding(response: flask.Response) -> flask.Response:
+    # Flask after_request hook: time spent serializing the callback output and
+    # size of the (uncompressed) response
+    if "metricsCallback" in flask.g and not response.direct_passthrough:
+        callbackName, callbackEnd = flask.g.metricsCallback
+        recordLatency(callbackName, "encode", time.perf_counter() - callbackEnd)
+        recordResponseSize(callbackName, response.content_length or 0)
+    return response
+
+
+def formatHistogram(
+    name: str, labels: str, histogram: list[float], buckets: list[float]
+) -> list[str]:
+    lines = []
+    cumulativeCount = 0
+    for bound, count in zip([*buckets, "+Inf"], histogram[:-1]):
+        cumulativeCount += count
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulativeCount:g}')
+    lines.append(f"{name}_sum{{{labels}}} {histogram[-1]:g}")
+    lines.append(f"{name}_count{{{labels}}} {cumulativeCount:g}")
+    return lines
+
+
+def renderMetrics() -> str:
+    # Prometheus text exposition format
+    with lock:
+        lines = [
+            "# HELP dashboard_callback_duration_seconds Duration of each callback phase",
+            "# TYPE dashboard_callback_duration_seconds histogram",
+        ]
+        for (callbackName, phase), histogram in sorted(latencies.items()):
+            lines += formatHistogram(
+                "dashboard_callback_duration_seconds",
+                f'callback="{callbackName}",phase="{phase}"',
+                histogram,
+                latencyBuckets,
+            )
+        lines += [
+            "# HELP dashboard_callback_response_bytes Uncompressed size of callback responses",
+            "# TYPE dashboard_callback_response_bytes histogram",
+        ]
+        for callbackName, histogram in sorted(responseSizes.items()):
+            lines += formatHistogram(
+                "dashboard_callback_response_bytes",
+                f'callback="{callbackName}"',
+                histogram,
+                sizeBuckets,
+            )
+        if startupSeconds is not None:
+            lines += [
+                "# HELP dashboard_startup_seconds Time taken by the app to be ready to serve",
+                "# TYPE dashboard_startup_seconds gauge",
+                f"dashboard_startup_seconds {startupSeconds}",
+                "# HELP dashboard_startup_budget_seconds Startup time the app should stay under",
+                "# TYPE dashboard_startup_budget_seconds gauge",
+                f"dashboard_startup_budget_seconds {config.STARTUP_TIME_BUDGET_SECONDS}",
+            ]
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager
+from src.utils import clean_data, get_data
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, where the dashboard runs in a single process (no gunicorn)
+    fcntl = None
+
+manifestPath = "data/manifest.json"
+lockPath = "data/prepare.lock"
+prewarmLockPath = "data/prewarm.lock"
+downloadedFiles = ["data/raw/world-education-data.csv"]
+inputFiles = [
+    "data/raw/world-education-data.csv",
+    "data/raw/country-and-continent-codes-list.csv",
+    "data/cleaned/countries.geo.json",
+]
+outputFiles = [
+    "data/cleaned/world-education-data",
+    "assets/countries.geo.json",
+]
+
+
+def hashFile(path: str) -> str | None:
+    # A directory is hashed as the sequence of its file names and contents
+    if not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        filePaths = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    else:
+        filePaths = [path]
+    digest = hashlib.sha256()
+    for filePath in filePaths:
+        if filePath != path:
+            digest.update(os.path.basename(filePath).encode())
+        with open(filePath, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def readManifest() -> dict[str, dict[str, str | None]]:
+    if not os.path.exists(manifestPath):
+        return {}
+    with open(manifestPath, "r") as f:
+        return json.load(f)
+
+
+def writeManifest(manifest: dict[str, dict[str, str | None]]) -> None:
+    # Write to a temporary file first so an interrupted run never leaves a
+    # truncated manifest behind
+    temporaryPath = f"{manifestPath}.tmp"
+    with open(temporaryPath, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporaryPath, manifestPath)
+
+
+@contextmanager
+def lockFile(path: str) -> Iterator[None]:
+    # Lock shared by all the processes and threads opening path, also released
+    # if the process dies holding it
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def lockDataset() -> AbstractContextManager[None]:
+    # The gunicorn workers each prepare the dataset when they start
+    return lockFile(lockPath)
+
+
+def prepareDataset(refresh: bool = False) -> bool:
+    # Download the raw dataset only when it is missing or a refresh is asked,
+    # then clean it only when the inputs or outputs changed since the last run.
+    # Returns True when the cleaning step was run.
+    # One process at a time, the others then find the manifest up to date.
+    with lockDataset():
+        if refresh or not all(os.path.exists(path) for path in downloadedFiles):
+            get_data.downloadDataset()
+
+        manifest = readManifest()
+        inputHashes = {path: hashFile(path) for path in inputFiles}
+        outputHashes = {path: hashFile(path) for path in outputFiles}
+        if (
+            manifest.get("inputs") == inputHashes
+            and manifest.get("outputs") == outputHashes
+        ):
+            return False
+
+        # Writes both outputs, the map only keeps the countries of the dataset
+        clean_data.cleanDataset()
+        writeManifest(
+            {
+                "inputs": inputHashes,
+                "outputs": {path: hashFile(path) for path in outputFiles},
+            }
+        )
+        return True
+
+
+def getFilesSignature(path: str) -> list[tuple[str, int, int]]:
+    # Name, size and modification time of the files at path, cheap to compare
+    # but changed by any rewrite
+    if not os.path.exists(path):
+        return []
+    if os.path.isdir(path):
+        filePaths = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    else:
+        filePaths = [path]
+    signature = []
+    for filePath in filePaths:
+        try:
+            fileStatus = os.stat(filePath)
+        except FileNotFoundError:
+            continue
+        signature.append((filePath, fileStatus.st_size, fileStatus.st_mtime_ns))
+    return signature
+
+
+def watchFiles(
+    path: str, onChange: Callable[[], None], interval: float
+) -> threading.Thread:
+    # Call onChange from a background thread after each change of the files at
+    # path, checked every interval seconds. A failing call is logged and made
+    # again at the next change.
+    def watch() -> None:
+        signature = getFilesSignature(path)
+        while True:
+            time.sleep(interval)
+            newSignature = getFilesSignature(path)
+            if newSignature == signature:
+                continue
+            signature = newSignature
+            try:
+                onChange()
+            except Exception:
+                logging.getLogger(__name__).exception("Reload of %s failed", path)
+
+    thread = threading.Thread(target=watch, name=f"watch-{path}", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,238 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pds
+
+# Compact on-disk types of the cleaned dataset, one .npy file per column
+yearType = np.int16
+indicatorType = np.float32
+# Countries are stored once in a dimension table, the facts only hold the
+# integer key of their country
+countryKeyColumn = "country_id"
+countryColumns = ["country", "country_code", "Continent_Name"]
+countriesFileName = "countries.json"
+# Rows copied at once when the written columns are turned into .npy files
+copyRows = 1 << 20
+
+
+class DatasetWriter:
+    # Writes a dataset chunk by chunk with a memory use that does not depend on
+    # its size: each column is appended to a raw file and turned into a .npy
+    # file when the writer is closed.
+    # The chunks identify their country by its row in countries (a table of
+    # country attributes such as country_code and Continent_Name) and by name.
+    # Only the countries found in the chunks are written to the dimension
+    # table, sorted by name, and the keys are renumbered accordingly.
+
+    def __init__(self, directory: str, countries: pds.DataFrame | None = None) -> None:
+        self.directory = directory
+        # A new directory next to the dataset for each writer, so that two
+        # writers never share it, which becomes the version of the dataset
+        # linked to by directory when the writer is closed
+        parentDirectory = os.path.dirname(os.path.abspath(directory))
+        os.makedirs(parentDirectory, exist_ok=True)
+        self.temporaryDirectory = tempfile.mkdtemp(
+            dir=parentDirectory,
+            prefix=f"{os.path.basename(directory)}.",
+            suffix=".tmp",
+        )
+        self.countries = countries
+        self.countryNames: dict[int, str] = {}
+        self.columns: list[str] | None = None
+        self.rows = 0
+
+    def getRawPath(self, columnName: str) -> str:
+        return os.path.join(self.temporaryDirectory, f"{columnName}.bin")
+
+    def getColumnType(self, columnName: str) -> type:
+        if columnName == countryKeyColumn:
+            return np.int32
+        return yearType if columnName == "year" else indicatorType
+
+    def append(self, data: pds.DataFrame) -> None:
+        if self.columns is None:
+            self.columns = [
+                columnName for columnName in data.columns if columnName != "country"
+            ]
+        if self.countries is not None:
+            # The name of a country is the first one found with its key
+            firstRows = data.drop_duplicates(subset=countryKeyColumn)
+            for key, name in zip(
+                firstRows[countryKeyColumn].tolist(), firstRows["country"].tolist()
+            ):
+                self.countryNames.setdefault(key, name)
+        for columnName in self.columns:
+            values = data[columnName].to_numpy(dtype=self.getColumnType(columnName))
+            with open(self.getRawPath(columnName), "ab") as f:
+                values.tofile(f)
+        self.rows += len(data)
+
+    def getCountries(self) -> pds.DataFrame:
+        # Rows of countries found so far, with their name
+        keys = sorted(self.countryNames)
+        return self.countries.loc[keys].assign(
+            country=[self.countryNames[key] for key in keys]
+        )
+
+    def close(self) -> None:
+        schema = {"rows": self.rows, "columns": {}}
+        remap = None
+        if self.countries is not None:
+            countries = self.getCountries().sort_values(by="country")
+            remap = np.full(len(self.countries), -1, dtype=np.int32)
+            remap[self.countries.index.get_indexer(countries.index)] = np.arange(
+                len(countries)
+            )
+            with open(
+                os.path.join(self.temporaryDirectory, countriesFileName), "w"
+            ) as f:
+                json.dump(
+                    {
+                        columnName: countries[columnName].tolist()
+                        for columnName in countries.columns
+                    },
+                    f,
+                    indent=2,
+                )
+
+        for columnName in self.columns or []:
+            rawType = self.getColumnType(columnName)
+            if self.rows == 0:
+                raw = np.empty(0, dtype=rawType)
+            else:
+                raw = np.memmap(self.getRawPath(columnName), dtype=rawType, mode="r")
+            if columnName == countryKeyColumn and remap is not None:
+                columnRemap = remap
+                dtype = np.min_scalar_type(-len(remap))
+                schema["columns"][columnName] = {"dimension": countriesFileName}
+            else:
+                columnRemap = None
+                dtype = raw.dtype
+                schema["columns"][columnName] = {}
+
+            values = np.lib.format.open_memmap(
+                os.path.join(self.temporaryDirectory, f"{columnName}.npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(self.rows,),
+            )
+            for start in range(0, self.rows, copyRows):
+                block = raw[start : start + copyRows]
+                values[start : start + copyRows] = (
+                    block if columnRemap is None else columnRemap[block]
+                )
+            values.flush()
+            del values, raw
+            os.remove(self.getRawPath(columnName))
+
+        with open(os.path.join(self.temporaryDirectory, "schema.json"), "w") as f:
+            json.dump(schema, f, indent=2)
+        # mkdtemp only gives access to its owner
+        os.chmod(self.temporaryDirectory, 0o755)
+        swapDirectory(self.temporaryDirectory, self.directory)
+
+
+def getVersionDirectories(directory: str) -> list[str]:
+    # Directories of the versions written for the dataset at directory
+    parentDirectory = os.path.dirname(os.path.abspath(directory))
+    prefix = f"{os.path.basename(directory)}."
+    return [
+        os.path.join(parentDirectory, name)
+        for name in os.listdir(parentDirectory)
+        if name.startswith(prefix)
+        and not name.endswith((".tmp", ".link"))
+        and os.path.isdir(os.path.join(parentDirectory, name))
+    ]
+
+
+def swapDirectory(temporaryDirectory: str, directory: str) -> None:
+    # The dataset path is a symbolic link to the directory of its current
+    # version, replaced in one step by os.replace: readers find either the
+    # previous version or the new one, never a missing directory. The previous
+    # version is kept until the next swap for the readers still opening it.
+    versionDirectory = temporaryDirectory.removesuffix(".tmp")
+    os.rename(temporaryDirectory, versionDirectory)
+    linkPath = f"{versionDirectory}.link"
+    try:
+        os.symlink(os.path.basename(versionDirectory), linkPath)
+    except OSError:
+        # No symbolic links (Windows without the privilege), the previous
+        # dataset is moved aside for a moment before the new one takes its place
+        previousDirectory = f"{versionDirectory}.old"
+        if os.path.exists(directory):
+            os.rename(directory, previousDirectory)
+        os.rename(versionDirectory, directory)
+        shutil.rmtree(previousDirectory, ignore_errors=True)
+        return
+
+    previousDirectory = None
+    if os.path.islink(directory):
+        previousDirectory = os.path.realpath(directory)
+    elif os.path.exists(directory):
+        # Dataset written before the versions, moved aside once
+        previousDirectory = f"{versionDirectory}.previous"
+        os.rename(directory, previousDirectory)
+    os.replace(linkPath, directory)
+    keptDirectories = {os.path.realpath(versionDirectory)}
+    if previousDirectory is not None:
+        keptDirectories.add(os.path.realpath(previousDirectory))
+    for oldDirectory in getVersionDirectories(directory):
+        if os.path.realpath(oldDirectory) not in keptDirectories:
+            shutil.rmtree(oldDirectory, ignore_errors=True)
+
+
+def writeDataset(data: pds.DataFrame, directory: str) -> None:
+    writer = DatasetWriter(directory)
+    writer.append(data)
+    writer.close()
+
+
+def readCountries(directory: str) -> pds.DataFrame:
+    # Country dimension table, indexed by country key
+    with open(os.path.join(directory, countriesFileName), "r") as f:
+        countries = pds.DataFrame(json.load(f))
+    countries.index.name = countryKeyColumn
+    return countries
+
+
+def readDataset(directory: str, columns: list[str] | None = None) -> pds.DataFrame:
+    # Only the requested columns are opened, and they are memory-mapped so that
+    # several processes reading the same dataset share the same pages.
+    # The country columns are looked up in the dimension table from the country
+    # key, as categoricals whose codes are computed with integer operations.
+    # The link to the current version is followed once, so that all the files
+    # come from the same version.
+    directory = os.path.realpath(directory)
+    with open(os.path.join(directory, "schema.json"), "r") as f:
+        schema = json.load(f)
+    if columns is None:
+        columns = list(schema["columns"])
+        if countryKeyColumn in columns:
+            columns += countryColumns
+
+    data = {}
+    countries = None
+    for columnName in columns:
+        if columnName not in countryColumns:
+            data[columnName] = np.load(
+                os.path.join(directory, f"{columnName}.npy"), mmap_mode="r"
+            )
+            continue
+        if countries is None:
+            countries = readCountries(directory)
+            keys = np.load(
+                os.path.join(directory, f"{countryKeyColumn}.npy"), mmap_mode="r"
+            )
+        data[columnName] = getCountryColumn(countries, columnName, keys)
+    return pds.DataFrame(data, copy=False)
+
+
+def getCountryColumn(
+    countries: pds.DataFrame, columnName: str, keys: np.ndarray
+) -> pds.Categorical:
+    # Attribute of the country of each key, as a categorical whose codes are
+    # the ones of its values in the dimension table
+    codes, categories = pds.factorize(countries[columnName], sort=True)
+    return pds.Categorical.from_codes(codes[keys], categories)
@@ -0,0 +1,107 @@
+import os
+import sys
+
+import pytest
+
+# The dashboard reads its data and assets relative to the repository root
+rootDirectory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(rootDirectory)
+sys.path.insert(0, rootDirectory)
+
+import config
+
+# No background work while main is imported, the tests start it themselves
+config.PREWARM_FIGURE_CACHE = False
+config.SPECULATIVE_PRECOMPUTE = False
+config.RELOAD_DATASET = False
+config.USE_DISK_CACHE = False
+
+
+@pytest.fixture(scope="session")
+def main():
+    import main
+
+    return main
+
+
+@pytest.fixture
+def postYear(main):
+    # Send the requests of the three slider graphs for a year, as the initial
+    # calls of a new page or as a move of the slider
+    client = main.server.test_client()
+
+    def post(year: int, displayPrimary: bool = True, initial: bool = False) -> None:
+        yearInput = [{"id": "year-slider", "property": "value", "value": year}]
+        changedPropIds = [] if initial else ["year-slider.value"]
+        requests = [
+            {
+                "output": "..educationWorldMap.figure...educationWorldMapTitle.children"
+                "...mapDescription.children..",
+                "outputs": [
+                    {"id": "educationWorldMap", "property": "figure"},
+                    {"id": "educationWorldMapTitle", "property": "children"},
+                    {"id": "mapDescription", "property": "children"},
+                ],
+                "inputs": yearInput,
+                "state": [
+                    {"id": "mapSchoolType", "property": "data", "value": displayPrimary}
+                ],
+                "changedPropIds": changedPropIds,
+            },
+            {
+                "output": "..bubbleGraph.figure...bubbleGraphTitle.children..",
+                "outputs": [
+                    {"id": "bubbleGraph", "property": "figure"},
+                    {"id": "bubbleGraphTitle", "property": "children"},
+                ],
+                "inputs": yearInput,
+                "changedPropIds": changedPropIds,
+            },
+            {
+                "output": "..continentGDPGraph.figure...continentGDPGraphTitle.children..",
+                "outputs": [
+                    {"id": "continentGDPGraph", "property": "figure"},
+                    {"id": "continentGDPGraphTitle", "property": "children"},
+                ],
+                "inputs": yearInput,
+                "changedPropIds": changedPropIds,
+            },
+        ]
+        for request in requests:
+            response = client.post("/_dash-update-component", json=request)
+            assert response.status_code == 200, response.data
+
+    return post
+
+
+@pytest.fixture
+def postMapType(main):
+    # Send the request of a click on one of the map buttons
+    client = main.server.test_client()
+    # The outputs shared with the slider callback have a suffix made by Dash
+    [output] = [
+        dependency["output"]
+        for dependency in client.get("/_dash-dependencies").get_json()
+        if "mapSchoolType.data" in dependency["output"]
+    ]
+
+    def post(year: int, displayPrimary: bool) -> None:
+        button = "map-button-elementary" if displayPrimary else "map-button-secondary"
+        request = {
+            "output": output,
+            "outputs": [
+                {"id": "educationWorldMap", "property": "figure"},
+                {"id": "educationWorldMapTitle", "property": "children"},
+                {"id": "mapSchoolType", "property": "data"},
+            ],
+            "inputs": [
+                {"id": "map-button-elementary", "property": "n_clicks", "value": None},
+                {"id": "map-button-secondary", "property": "n_clicks", "value": None},
+            ],
+            "state": [{"id": "year-slider", "property": "value", "value": year}],
+            "changedPropIds": [f"{button}.n_clicks"],
+        }
+        response = client.post("/_dash-update-component", json=request)
+        assert response.status_code == 200, response.data
+
+    return post
@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pds
+import pytest
+
+from src.utils import clean_data, format_graph_data, store_data
+
+rawPath = "data/raw/world-education-data.csv"
+datasetDirectory = "data/cleaned/world-education-data"
+assetPath = "assets/countries.geo.json"
+
+
+@pytest.fixture
+def workDirectory(tmp_path, monkeypatch):
+    # Copy of the inputs of the clean stage, which then writes its outputs
+    # next to them instead of in the repository
+    for path in (
+        rawPath,
+        "data/raw/country-and-continent-codes-list.csv",
+        "data/cleaned/countries.geo.json",
+    ):
+        os.makedirs(tmp_path / os.path.dirname(path), exist_ok=True)
+        shutil.copy(path, tmp_path / path)
+    os.makedirs(tmp_path / "assets")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def writeWideDataset() -> None:
+    # The raw dataset in the layout of the World Bank WDI files, with an
+    # indicator that is not charted
+    longData = pds.read_csv(rawPath)
+    indicatorCodes = {
+        columnName: indicatorCode
+        for indicatorCode, columnName in clean_data.wdiIndicatorCodes.items()
+    }
+    longData["OTHER.INDICATOR"] = 1.0
+    indicatorCodes["OTHER.INDICATOR"] = "OTHER.INDICATOR"
+    wideData = (
+        longData.rename(columns=indicatorCodes)
+        .melt(
+            id_vars=["country", "country_code", "year"],
+            var_name="Indicator Code",
+        )
+        .pivot(
+            index=["country", "country_code", "Indicator Code"],
+            columns="year",
+            values="value",
+        )
+        .reset_index()
+        .rename(columns={"country": "Country Name", "country_code": "Country Code"})
+    )
+    wideData.insert(2, "Indicator Name", wideData["Indicator Code"])
+    wideData.to_csv(rawPath, index=False)
+
+
+def readOutputs() -> dict[str, object]:
+    # Contents of the written dataset and map
+    outputs = {}
+    for name in sorted(os.listdir(datasetDirectory)):
+        path = os.path.join(datasetDirectory, name)
+        if name.endswith(".npy"):
+            outputs[name] = np.load(path)
+        else:
+            with open(path, "r") as f:
+                outputs[name] = json.load(f)
+    with open(assetPath, "r") as f:
+        outputs[assetPath] = f.read()
+    return outputs
+
+
+def assertOutputsEqual(outputs: dict[str, object], expected: dict[str, object]) -> None:
+    assert outputs.keys() == expected.keys()
+    for name, value in expected.items():
+        if name.endswith(".npy"):
+            np.testing.assert_array_equal(outputs[name], value)
+            assert outputs[name].dtype == value.dtype
+        else:
+            assert outputs[name] == value, name
+
+
+@pytest.mark.parametrize("isWide", [False, True])
+def test_chunks_and_workers_give_the_same_dataset(workDirectory, isWide):
+    if isWide:
+        writeWideDataset()
+    clean_data.cleanDataset(chunkRows=1_000_000, workers=1)
+    expected = readOutputs()
+    # Chunks that split the rows of some countries in the wide layout
+    clean_data.cleanDataset(chunkRows=250, workers=3)
+    assertOutputsEqual(readOutputs(), expected)
+
+    # The dataset is a link to its current version, the previous one is kept
+    assert os.path.islink(datasetDirectory)
+    assert len(store_data.getVersionDirectories(datasetDirectory)) == 2
+    clean_data.cleanDataset(chunkRows=250, workers=1)
+    assertOutputsEqual(readOutputs(), expected)
+    assert len(store_data.getVersionDirectories(datasetDirectory)) == 2
+
+
+def test_wide_and_long_layouts_give_the_same_data(workDirectory):
+    clean_data.cleanDataset()
+    expected = store_data.readDataset(datasetDirectory)
+    expectedCountries = store_data.readCountries(datasetDirectory)
+    writeWideDataset()
+    clean_data.cleanDataset(chunkRows=250)
+    actual = store_data.readDataset(datasetDirectory)
+    columns = ["country_id", "year", *format_graph_data.indicatorColumns]
+    pds.testing.assert_frame_equal(
+        actual[columns].sort_values(by=["country_id", "year"], ignore_index=True),
+        expected[columns].sort_values(by=["country_id", "year"], ignore_index=True),
+    )
+    pds.testing.assert_frame_equal(
+        store_data.readCountries(datasetDirectory), expectedCountries
+    )
@@ -0,0 +1,103 @@
+import json
+
+import plotly.io as pio
+import pytest
+from dash._utils import to_json
+
+import config
+from src.utils import draw_graph, format_graph_data
+
+
+def assertDrawnAsWithoutTemplate(monkeypatch, draw, *arguments) -> None:
+    # A figure drawn from a template is the one plotly express would draw, as
+    # JSON (the layout keys are not in the same order) and as sent by Dash
+    monkeypatch.setattr(config, "USE_FIGURE_TEMPLATES", False)
+    expected = draw(*arguments)
+    monkeypatch.setattr(config, "USE_FIGURE_TEMPLATES", True)
+    # The first figure of its kind is kept as the template
+    draw(*arguments)
+    figure = draw(*arguments)
+    assert json.loads(pio.to_json(figure, validate=False)) == json.loads(
+        pio.to_json(expected, validate=False)
+    )
+    assert json.loads(to_json(draw_graph.encodeFigure(figure))) == json.loads(
+        to_json(draw_graph.encodeFigure(expected))
+    )
+
+
+# 1995 has no data for some continents
+@pytest.mark.parametrize("year", [1995, 1999, 2010, 2020, 2023])
+def test_year_figures(main, monkeypatch, year):
+    data = main.dashboardData
+    for displayPrimary in (True, False):
+        mapData, maxPupilTeacher = format_graph_data.getMapDataFromCube(
+            data.worldEducationCube, year, displayPrimary
+        )
+        assertDrawnAsWithoutTemplate(
+            monkeypatch,
+            draw_graph.drawEducationWorldMap,
+            mapData,
+            main.countries,
+            displayPrimary,
+            maxPupilTeacher,
+        )
+    assertDrawnAsWithoutTemplate(
+        monkeypatch,
+        draw_graph.drawBubbleGraph,
+        format_graph_data.getBubbleData(data.worldEducation, year),
+    )
+    assertDrawnAsWithoutTemplate(
+        monkeypatch,
+        draw_graph.drawContinentGDPGraph,
+        format_graph_data.getContinentEducationDataFromRollups(
+            data.worldEducationRollups, year
+        ),
+    )
+
+
+def test_continent_subsets(main, monkeypatch):
+    bubbleData = format_graph_data.getBubbleData(main.dashboardData.worldEducation, 2020)
+    continentData = format_graph_data.getContinentEducationDataFromRollups(
+        main.dashboardData.worldEducationRollups, 2020
+    )
+    for subset in (
+        bubbleData[bubbleData["Continent_Name"] == "Africa"],
+        bubbleData[bubbleData["Continent_Name"] != "Asia"],
+        bubbleData.sample(frac=1, random_state=0),
+        bubbleData.iloc[0:0],
+    ):
+        assertDrawnAsWithoutTemplate(monkeypatch, draw_graph.drawBubbleGraph, subset)
+    for subset in (
+        continentData[continentData["Continent_Name"] != "Oceania"],
+        continentData.iloc[::-1],
+        continentData.iloc[0:0],
+    ):
+        assertDrawnAsWithoutTemplate(
+            monkeypatch, draw_graph.drawContinentGDPGraph, subset
+        )
+
+
+@pytest.mark.parametrize(
+    "yearRange, continentNames",
+    [(None, None), ((2000, 2010), ["Asia", "Europe"]), ((2005, 2006), ["Oceania"])],
+)
+def test_heatmap(main, monkeypatch, yearRange, continentNames):
+    correlationData = main.dashboardData.getCorrelationData(yearRange, continentNames)
+    for shouldDisplayText in (True, False):
+        assertDrawnAsWithoutTemplate(
+            monkeypatch, draw_graph.drawHeatMap, correlationData, shouldDisplayText
+        )
+
+
+@pytest.mark.parametrize("countryName", ["France", "Chad", "Nowhere"])
+def test_country_figures(main, monkeypatch, countryName):
+    countryIndex = main.dashboardData.worldEducationByCountry
+    countryData = format_graph_data.getCountryData(
+        countryIndex, format_graph_data.getCountryKey(countryIndex, countryName)
+    )
+    assertDrawnAsWithoutTemplate(
+        monkeypatch, draw_graph.drawCountryCurveEvolution, countryData
+    )
+    assertDrawnAsWithoutTemplate(
+        monkeypatch, draw_graph.drawCountryPIBLiteratePopulation, countryData
+    )
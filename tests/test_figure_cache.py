@@ -0,0 +1,103 @@
+import time
+from collections.abc import Callable
+
+import config
+from src.utils import disk_cache, figure_cache, format_graph_data, pipeline
+
+yearGraphs = ["educationWorldMap", "bubbleGraph", "continentGDPGraph"]
+
+
+def getCounts(name: str) -> tuple[int, int]:
+    statistics = figure_cache.getCacheStatistics()[name]
+    return statistics["hits"], statistics["misses"]
+
+
+def assertServedFromCache(names: list[str], send: Callable[[], None]) -> None:
+    # Each cache of names gets exactly one more hit and no miss
+    before = {name: getCounts(name) for name in names}
+    send()
+    for name in names:
+        hits, misses = before[name]
+        assert getCounts(name) == (hits + 1, misses), name
+
+
+def waitForSpeculations() -> None:
+    # Until every scheduled speculation was computed, failed or cancelled
+    deadline = time.monotonic() + 30
+    while True:
+        statistics = figure_cache.getCacheStatistics()["speculation"]
+        done = statistics["computed"] + statistics["failed"] + statistics["cancelled"]
+        if done == statistics["scheduled"]:
+            return
+        assert time.monotonic() < deadline, "speculations still running"
+        time.sleep(0.01)
+
+
+def test_prewarm_serves_the_page_and_the_slider(main, postYear):
+    figure_cache.clearCaches()
+    main.prewarmCaches(main.dashboardData, background=False)
+    assertServedFromCache(yearGraphs, lambda: postYear(main.defaultYear, initial=True))
+    for year in (2005, 2006):
+        assertServedFromCache(yearGraphs, lambda: postYear(year))
+
+
+def test_prewarm_waits_for_the_other_processes(main):
+    figure_cache.clearCaches()
+    # As while another worker prewarms the caches
+    with pipeline.lockFile(pipeline.prewarmLockPath):
+        thread = main.prewarmCaches(main.dashboardData, background=True)
+        thread.join(timeout=0.5)
+        assert thread.is_alive()
+        assert figure_cache.getCacheStatistics()["bubbleGraph"]["size"] == 0
+    thread.join()
+    assert figure_cache.getCacheStatistics()["bubbleGraph"]["size"] > 0
+
+
+def test_speculated_figures_are_served_from_the_cache(
+    main, postYear, postMapType, monkeypatch
+):
+    monkeypatch.setattr(config, "SPECULATIVE_PRECOMPUTE", True)
+    monkeypatch.setattr(config, "SPECULATION_DELAY_SECONDS", 0)
+    figure_cache.clearCaches()
+    postYear(2010)
+    waitForSpeculations()
+    # No new speculation while the next requests are counted
+    monkeypatch.setattr(config, "SPECULATIVE_PRECOMPUTE", False)
+
+    # The other map type of the same year, then the neighbouring years
+    assertServedFromCache(
+        ["educationWorldMap"], lambda: postMapType(2010, displayPrimary=False)
+    )
+    for year in (2011, 2009):
+        assertServedFromCache(yearGraphs, lambda: postYear(year))
+
+
+def test_disk_cache_waits_for_its_version(main, monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "USE_DISK_CACHE", True)
+    monkeypatch.setattr(config, "DISK_CACHE_DIRECTORY", str(tmp_path))
+    figure_cache.clearCaches()
+    # As in a script that reads the dataset without main.py
+    monkeypatch.setattr(disk_cache, "version", "")
+    format_graph_data.buildCorrelationEngine(main.dashboardData.worldEducation)()
+    assert list(tmp_path.iterdir()) == []
+
+    disk_cache.setVersion("test")
+    main.getHeatMap(main.dashboardData, False)
+    assert len(list(tmp_path.iterdir())) > 0
+
+
+def test_disk_cache_scans_its_directory_above_the_limit(monkeypatch, tmp_path):
+    monkeypatch.setattr(config, "DISK_CACHE_DIRECTORY", str(tmp_path))
+    monkeypatch.setattr(config, "DISK_CACHE_MAX_BYTES", 100_000)
+    monkeypatch.setattr(disk_cache, "estimatedBytes", None)
+    disk_cache.clear()
+    scans = disk_cache.getStatistics()["scans"]
+    for index in range(1000):
+        disk_cache.write(f"key{index}", bytes(1000))
+        totalBytes = sum(path.stat().st_size for path in tmp_path.iterdir())
+        assert totalBytes <= config.DISK_CACHE_MAX_BYTES
+    # About one scan per tenth of the limit written, not one per write
+    assert disk_cache.getStatistics()["scans"] - scans < 100
+    # The most recently written results are kept
+    assert disk_cache.read("key999") == (True, bytes(1000))
+    assert disk_cache.read("key0") == (False, None)
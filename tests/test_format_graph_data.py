@@ -0,0 +1,275 @@
+import numpy as np
+import pandas as pds
+import pytest
+
+import config
+from src.utils import format_graph_data, store_data
+
+datasetDirectory = "data/cleaned/world-education-data"
+# Years before, during and after the dataset
+years = range(1990, 2030)
+
+
+@pytest.fixture(scope="module")
+def worldEducation():
+    return store_data.readDataset(datasetDirectory)
+
+
+@pytest.fixture(scope="module")
+def countries():
+    return store_data.readCountries(datasetDirectory)
+
+
+@pytest.fixture(scope="module")
+def cube(worldEducation, countries):
+    return format_graph_data.buildAsOfCube(worldEducation, countries)
+
+
+def getValuesByCountry(data: pds.DataFrame, columnName: str) -> pds.Series:
+    values = pds.Series(
+        data[columnName].to_numpy(), index=data["country"].astype(str).to_numpy()
+    )
+    return values.sort_index()
+
+
+@pytest.mark.parametrize("displayPrimary", [True, False])
+def test_map_data_from_cube(worldEducation, countries, cube, displayPrimary):
+    columnName = format_graph_data.getPupilTeacherColumn(displayPrimary)
+    withoutPolygon = set(countries.loc[countries["feature_index"] < 0, "country"])
+    for year in years:
+        expected, _ = format_graph_data.getMapData(worldEducation, year, displayPrimary)
+        mapData, maxPupilTeacher = format_graph_data.getMapDataFromCube(
+            cube, year, displayPrimary
+        )
+        # The countries that have no polygon on the map are left out
+        expected = expected[~expected["country"].isin(withoutPolygon)]
+        expected = getValuesByCountry(expected, columnName)
+        pds.testing.assert_series_equal(
+            getValuesByCountry(mapData, columnName), expected, check_dtype=False
+        )
+        assert not set(mapData["country"]) & withoutPolygon
+        assert maxPupilTeacher == expected.max() or (
+            np.isnan(maxPupilTeacher) and expected.empty
+        )
+
+
+def test_continent_data_from_cube_and_rollups(worldEducation, cube):
+    rollups = format_graph_data.buildRollups(cube)
+    for year in years:
+        expected = format_graph_data.getContinentEducationData(worldEducation, year)
+        expected["Continent_Name"] = expected["Continent_Name"].astype(str)
+        for actual in (
+            format_graph_data.getContinentEducationDataFromCube(cube, year),
+            format_graph_data.getContinentEducationDataFromRollups(rollups, year),
+        ):
+            actual["Continent_Name"] = actual["Continent_Name"].astype(str)
+            pds.testing.assert_frame_equal(
+                actual.reset_index(drop=True),
+                expected.reset_index(drop=True),
+                check_dtype=False,
+                rtol=1e-6,
+            )
+
+
+def assertRollupsMatchGroupBy(cube, rollups):
+    # Statistics of the latest known values of the countries of each continent
+    # and of the world, as computed by pandas
+    groups = [*sorted(cube.countries["Continent_Name"].unique()), "World"]
+    assert rollups.groups == groups
+    for year in years:
+        latestValues = pds.DataFrame(
+            {
+                columnName: format_graph_data.getAsOfValues(cube, year, columnName)
+                for columnName in cube.columns
+            }
+        )
+        expected = pds.concat(
+            [
+                latestValues.groupby(
+                    cube.countries["Continent_Name"].to_numpy()
+                ).agg(format_graph_data.rollupStatistics),
+                latestValues.agg(format_graph_data.rollupStatistics)
+                .unstack()
+                .to_frame("World")
+                .T,
+            ]
+        )
+        for columnName in cube.columns:
+            for statistic in format_graph_data.rollupStatistics:
+                np.testing.assert_allclose(
+                    format_graph_data.getRollupValues(
+                        rollups, year, columnName, statistic
+                    ),
+                    expected.loc[groups, (columnName, statistic)].to_numpy(dtype=float),
+                    rtol=1e-9,
+                    err_msg=f"{year} {columnName} {statistic}",
+                )
+
+
+# pandas warns for the median of the groups without any value
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+def test_rollups(cube):
+    assertRollupsMatchGroupBy(cube, format_graph_data.buildRollups(cube))
+
+
+@pytest.mark.filterwarnings("ignore:Mean of empty slice")
+def test_rollups_of_a_new_version(cube):
+    previousRollups = format_graph_data.buildRollups(cube)
+    # A new version that changes some values of a few years
+    values = cube.values.copy()
+    values[0, 5, 2] = 1234.5
+    values[3, 10:, 0] = np.nan
+    values[:, -1, 4] = 7.0
+    newCube = cube._replace(values=values)
+    rollups = format_graph_data.buildRollups(newCube, cube, previousRollups)
+    assertRollupsMatchGroupBy(newCube, rollups)
+    np.testing.assert_array_equal(
+        rollups.values, format_graph_data.buildRollups(newCube).values
+    )
+    # The unchanged years are copied from the previous rollups
+    np.testing.assert_array_equal(rollups.values[:, 1:5], previousRollups.values[:, 1:5])
+
+    # With other countries, everything is computed again
+    otherCube = newCube._replace(countries=newCube.countries.iloc[::-1])
+    rollups = format_graph_data.buildRollups(otherCube, cube, previousRollups)
+    assertRollupsMatchGroupBy(otherCube, rollups)
+
+
+# The clean stage writes the rows sorted by country then year, any order works
+@pytest.mark.parametrize("isShuffled", [False, True])
+def test_country_index(worldEducation, countries, isShuffled):
+    if isShuffled:
+        worldEducation = worldEducation.sample(frac=1, random_state=0)
+        worldEducation = worldEducation.reset_index(drop=True)
+    index = format_graph_data.buildCountryIndex(worldEducation, countries)
+    assert (index.order is None) != isShuffled
+    for key, country in zip(countries.index, countries["country"]):
+        expected = worldEducation[worldEducation["country"] == country]
+        expected = expected.sort_values(by="year", kind="stable")
+        for name in (country, countries.loc[key, "country_code"]):
+            assert format_graph_data.getCountryKey(index, name) == key
+        actual = format_graph_data.getCountryData(index, key)
+        pds.testing.assert_frame_equal(
+            actual.reset_index(drop=True), expected.reset_index(drop=True)
+        )
+    assert format_graph_data.getCountryKey(index, "Nowhere") is None
+    assert format_graph_data.getCountryData(index, None).empty
+
+
+# (first, last) year range and continents of the filters, the last ones select no row
+correlationFilters = [
+    (None, None),
+    ((2005, 2010), None),
+    (None, ["Europe"]),
+    ((2000, 2015), ["Africa", "Asia"]),
+    ((1800, 1801), None),
+    (None, ["Nowhere"]),
+]
+
+
+@pytest.mark.parametrize("yearRange, continentNames", correlationFilters)
+def test_correlation(worldEducation, monkeypatch, yearRange, continentNames):
+    # Small blocks so that the sums are made over several of them
+    monkeypatch.setattr(format_graph_data, "correlationBlockRows", 500)
+    selected = worldEducation
+    if yearRange is not None:
+        selected = selected[selected["year"].between(*yearRange)]
+    if continentNames is not None:
+        selected = selected[selected["Continent_Name"].isin(continentNames)]
+    expected = selected[format_graph_data.indicatorColumns].astype(float).corr()
+    labels = [
+        format_graph_data.correlationLabels[columnName]
+        for columnName in format_graph_data.indicatorColumns
+    ]
+    expected.index = expected.columns = labels
+    if selected.empty:
+        assert expected.isna().all().all()
+
+    columns = [
+        worldEducation[columnName].to_numpy()
+        for columnName in format_graph_data.indicatorColumns
+    ]
+    rows = (
+        None
+        if yearRange is None and continentNames is None
+        else np.flatnonzero(worldEducation.index.isin(selected.index))
+    )
+    np.testing.assert_allclose(
+        format_graph_data.getPairwiseCorrelation(columns, rows),
+        expected.to_numpy(),
+        rtol=1e-9,
+        atol=1e-12,
+    )
+    getCorrelation = format_graph_data.buildCorrelationEngine(worldEducation)
+    pds.testing.assert_frame_equal(
+        getCorrelation(yearRange, continentNames), expected, atol=0.005 + 1e-9
+    )
+
+
+def test_bubble_data_is_binned_above_the_threshold():
+    random = np.random.default_rng(0)
+    bins = config.BUBBLE_BINS
+    rows = config.BUBBLE_BINNING_THRESHOLD + 500
+    # Points near the centers of the cells of a grid from 0 to 100 on both axes,
+    # away from their edges, and the corners that fix the range of the grid
+    width = 100 / bins
+    xCells = random.integers(0, bins, rows)
+    yCells = random.integers(0, bins // 3, rows)
+    x = (xCells + 0.5 + random.uniform(-0.4, 0.4, rows)) * width
+    y = (yCells + 0.5 + random.uniform(-0.4, 0.4, rows)) * width
+    x[:2], y[:2] = (0, 100), (0, 100)
+    xCells[:2], yCells[:2] = (0, bins - 1), (0, bins - 1)
+    continents = np.array(["Africa", "Asia", "Europe"])
+    baseData = pds.DataFrame(
+        {
+            "country": [f"Country {row}" for row in range(rows)],
+            "Continent_Name": continents[random.integers(0, 3, rows)],
+            "year": 2020,
+            "school_enrol_primary_pct": x,
+            "pri_comp_rate_pct": y,
+            "gov_exp_pct_gdp": random.uniform(0, 10, rows),
+        }
+    )
+    # Unknown investments count as 0, points without a position are left out
+    baseData.loc[2:100, "gov_exp_pct_gdp"] = np.nan
+    baseData.loc[101:120, "pri_comp_rate_pct"] = np.nan
+    # Another year, not charted
+    baseData = pds.concat([baseData, baseData.assign(year=2019)], ignore_index=True)
+
+    bubbleData = format_graph_data.getBubbleData(baseData, 2020)
+
+    points = baseData[baseData["year"] == 2020].iloc[:rows].assign(
+        xCell=xCells, yCell=yCells
+    )
+    points = points.dropna(subset=["pri_comp_rate_pct"])
+    points["gov_exp_pct_gdp"] = points["gov_exp_pct_gdp"].fillna(0)
+    cells = points.groupby(["xCell", "yCell"])
+    expected = pds.DataFrame(
+        {
+            "count": cells.size(),
+            "gov_exp_pct_gdp": cells["gov_exp_pct_gdp"].mean(),
+            # The first continent in alphabetical order among the most frequent
+            "Continent_Name": cells["Continent_Name"].agg(
+                lambda names: names.value_counts().sort_index().idxmax()
+            ),
+        }
+    ).reset_index()
+    actual = bubbleData.assign(
+        count=bubbleData["country"].str.removesuffix(" pays").astype(int),
+        xCell=(bubbleData["school_enrol_primary_pct"] // width).astype(int),
+        yCell=(bubbleData["pri_comp_rate_pct"] // width).astype(int),
+    )
+    actual = actual.sort_values(by=["xCell", "yCell"], ignore_index=True)
+
+    assert len(bubbleData) < config.BUBBLE_BINNING_THRESHOLD
+    assert actual["count"].sum() == len(points)
+    pds.testing.assert_frame_equal(
+        actual[expected.columns], expected, check_dtype=False, rtol=1e-9
+    )
+    # The bubbles are at the centers of their cells
+    np.testing.assert_allclose(
+        actual["school_enrol_primary_pct"], (actual["xCell"] + 0.5) * width
+    )
+    np.testing.assert_allclose(
+        actual["pri_comp_rate_pct"], (actual["yCell"] + 0.5) * width
+    )
@@ -0,0 +1,48 @@
+import gc
+import weakref
+
+import config
+from src.utils import figure_cache, pipeline
+
+
+def test_reload_frees_the_previous_dataset(main, postYear, monkeypatch):
+    monkeypatch.setattr(config, "PREWARM_FIGURE_CACHE", True)
+    # A dataset version the callbacks fill the caches with, then replaced
+    previousData = main.DashboardData("previous")
+    monkeypatch.setattr(main, "dashboardData", previousData)
+    figure_cache.clearCaches()
+    postYear(main.defaultYear, initial=True)
+    postYear(2010)
+    main.getCountryGraphs(previousData, None)
+    previousData.getCorrelationData((2000, 2010), ["Europe"])
+    correlationCache = figure_cache.registeredCaches["correlationData"]
+
+    monkeypatch.setattr(pipeline, "hashFile", lambda path: "reloaded")
+    main.reloadDashboardData()
+    assert main.dashboardData.version == "reloaded"
+    # The new version was prewarmed and its entries are kept
+    assert figure_cache.getCacheStatistics()["bubbleGraph"]["size"] > 0
+    # The engines of both versions share one cache
+    assert figure_cache.registeredCaches["correlationData"] is correlationCache
+    assert correlationCache.entries
+    assert all(
+        arguments[0] is main.dashboardData.getCorrelationData
+        for arguments in correlationCache.entries
+    )
+
+    previousDataReference = weakref.ref(previousData)
+    del previousData
+    gc.collect()
+    assert previousDataReference() is None
+
+
+def test_map_geometry_url_changes_with_the_asset(main, monkeypatch):
+    url = main.getCountriesUrl(main.dashboardData)
+    response = main.server.test_client().get(url)
+    assert response.status_code == 200
+    with open(main.countriesAssetPath, "rb") as f:
+        assert response.data == f.read()
+
+    # As after a new dataset rewrote the geometry
+    monkeypatch.setattr(pipeline, "hashFile", lambda path: "rewritten")
+    assert main.getCountriesUrl(main.DashboardData("reloaded")) != url